@@ -1,12 +1,15 @@
 import streamlit as st
 from utils import image_utils
-from models import llm, segmentation
+from models import llm, segmentation, story_cache, prefetch, router
+from utils import admission, metrics, session_store, transport
 from utils.prompt_utils import PromptBuilder
-from utils.coco_class_map import COCO_CLASS_TRANSLATION, preprocess_class_name
-import time
+from utils.coco_class_map import COCO_CLASS_TRANSLATION, translate_many
+import itertools
+import threading
 import config
-import numpy as np
-from PIL import Image
+
+STORY_TEMPERATURE = 0.7
+AUTO_CHOICE = "Automaticky"
 
 
 # Inicializace proměnných v session state
@@ -15,13 +18,20 @@ if "labels" not in st.session_state:
 if "processed_image" not in st.session_state:
     st.session_state.processed_image = None
 if "segmented_image" not in st.session_state:
+    # Jen jméno položky v session_store - samotný obrázek se drží zakódovaný mimo session state
     st.session_state.segmented_image = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = session_store.store.new_session_id()
 if "show_original" not in st.session_state:
     st.session_state.show_original = True
 if "segment_attempt" not in st.session_state:
     st.session_state.segment_attempt = False
 if "show_segment_button" not in st.session_state:
     st.session_state.show_segment_button = True
+if "prefetcher" not in st.session_state:
+    st.session_state.prefetcher = prefetch.StoryPrefetcher()
+if "prefetch_started" not in st.session_state:
+    st.session_state.prefetch_started = False
 
 
 # Sidebar
@@ -44,12 +54,67 @@ api_key_openai = openai_api_key or config.OPENAI_API_KEY
 # Výběr modelu pro generování textu
 model_choice = st.sidebar.radio(
     "Vyber model pro generování příběhu:",
-    ("Perplexity", "OpenAI"),
+    ("Perplexity", "OpenAI", AUTO_CHOICE),
     index=0,
-    key="llm_choice"
+    key="llm_choice",
+    help="Při výpadku zvoleného modelu se příběh vygeneruje druhým. Automaticky = vždy ten, který je právě nejrychlejší."
 )
 
 
+# Třídy klientů podle poskytovatele (synchronní, asynchronní pro prefetch)
+LLM_CLASSES = {
+    "Perplexity": (llm.PerplexityLLM, llm.AsyncPerplexityLLM),
+    "OpenAI": (llm.OpenAILLM, llm.AsyncOpenAILLM),
+}
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_llm(provider, api_key, use_async=False):
+    """
+    Klient LLM sdílený napříč reruny i sessions (jeden na poskytovatele a klíč).
+    SDK poskytovatele (openai) se načte až tady - tedy jen když je poskytovatel opravdu použitý.
+    """
+    return LLM_CLASSES[provider][1 if use_async else 0](api_key=api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def warm_start():
+    """
+    Jednou za proces: po prvním vykreslení stránky na pozadí načte HTTP knihovny a SDK,
+    aby na ně nečekal první klik uživatele (start kontejneru zůstává rychlý)
+    """
+    backend_url = getattr(segmentation.get_backend(), "url", None)
+    urls = [url for url in (backend_url, llm.PerplexityLLM().base_url) if url]
+    thread = threading.Thread(target=transport.warm_up, args=(urls,), name="warm-start", daemon=True)
+    thread.start()
+    return thread
+
+
+def show_queue_position(placeholder):
+    """Callback pro admission: pozice ve frontě a odhad čekání do daného místa ve stránce"""
+    def on_wait(position, estimate):
+        placeholder.caption(f"Hodně zájemců najednou 🚶 Jsi {position}. ve frontě, odhadem {max(estimate, 1):.0f} s...")
+    return on_wait
+
+
+def build_llm_router():
+    """Router nad poskytovateli LLM - volba v sidebaru je preference, při chybě se přepne na dalšího"""
+    providers = {}
+    if api_key_per:
+        providers["Perplexity"] = get_llm("Perplexity", api_key_per)
+    if api_key_openai:
+        providers["OpenAI"] = get_llm("OpenAI", api_key_openai)
+    if not providers:
+        # Bez klíčů necháme chybu zobrazit poskytovatelem
+        providers["Perplexity"] = get_llm("Perplexity", api_key_per)
+    preferred = None if model_choice == AUTO_CHOICE else model_choice
+    return router.LLMRouter(providers, preferred)
+
+
+# Segmentace po dlaždicích v plném rozlišení (pomalejší, ale zachytí i malé objekty)
+tiled_mode = st.sidebar.checkbox("Vysoké rozlišení (segmentace po dlaždicích)", value=False, key="tiled_mode")
+
+
 # Hlavní část aplikace
 uploaded_file = st.sidebar.file_uploader("Nahraj obrázek. Neboj, zůstane jen u tebe! \U0000267B Přípona souboru musí být malými pismeny (např. .jpg, .jpeg, .png)", type=["jpg", "jpeg", "png"])
 
@@ -60,17 +125,24 @@ if uploaded_file:
     if uploaded_file and st.session_state.show_segment_button:
         if st.button("Segmentovat"):
             with st.spinner("Už asi něco vidím, chvíli strpení... \U0001F441"):
-                img = image_utils.process_image(uploaded_file)
+                trace = metrics.start_trace("Segmentovat")
+                with metrics.span("process_image"):
+                    if tiled_mode:
+                        img = image_utils.process_image(uploaded_file, max_size=config.TILED_MAX_SIZE)
+                    else:
+                        img = image_utils.process_image(uploaded_file)
 
                 # Získání segmentovaného obrázku a tříd
-                segmented_img, labels = segmentation.segment_image(img, api_key_hf)
-
-                # Ujistit se, že segmented_img je ve správném formátu pro zobrazení
-                if isinstance(segmented_img, np.ndarray):
-                    segmented_img = Image.fromarray(segmented_img)
-
-                # Uložení do session state
-                st.session_state.segmented_image = segmented_img
+                # Při vytížení API se místo nekonečného spinneru ukáže pozice ve frontě
+                queue_info = st.empty()
+                with metrics.span("segment_image"), admission.session(st.session_state.session_id, show_queue_position(queue_info)):
+                    segmented_img, labels = segmentation.segment_image(img, api_key_hf, tiled=tiled_mode)
+                queue_info.empty()
+                st.session_state.last_trace = metrics.finish_trace(trace)
+
+                # Uložení výsledku ve zmenšené a zakódované podobě (session state drží jen odkaz)
+                session_store.store.put(st.session_state.session_id, "segmented_image", session_store.encode_display_image(segmented_img))
+                st.session_state.segmented_image = "segmented_image"
                 st.session_state.labels = labels
                 st.session_state.show_original = False
                 st.session_state.segment_attempt = True
@@ -80,34 +152,41 @@ if uploaded_file:
 
 # Zobrazení výsledků
 if "segmented_image" in st.session_state and st.session_state.segmented_image is not None:
-    # Převedení na PIL Image
-    if isinstance(st.session_state.segmented_image, np.ndarray):
-        display_img = Image.fromarray(st.session_state.segmented_image)
-    else:
-        display_img = st.session_state.segmented_image
+    display_img = session_store.store.get(st.session_state.session_id, st.session_state.segmented_image)
 
-    # Zobrazení segmentovaného obrázku
-    st.image(display_img, caption="Tak to vidí Mask2Former", width=600)
+    # Zobrazení segmentovaného obrázku (JPEG bytes dekóduje až prohlížeč)
+    if display_img is not None:
+        st.image(display_img, caption="Tak to vidí Mask2Former", width=600)
+    else:
+        st.info("Výsledek segmentace už vypršel, stačí obrázek segmentovat znovu.")
+        st.session_state.segmented_image = None
+        st.session_state.show_segment_button = True
 
 if st.session_state.labels:
     st.session_state.segment_attempt = False
-    unique_labels = sorted(st.session_state.labels)
-
-    # Překlad a deduplikace
-    translated_labels = []
-    for label in unique_labels:
-
-        # Zpracování speciálních přípon
-        translated = preprocess_class_name(label)
+    # Třídy už jsou seřazené podle významnosti (plocha vážená skóre) - nejdřív hlavní objekty
+    unique_labels = st.session_state.labels
 
-        # Ošetření neznámých tříd
-        if translated == label:
-            translated += " (nepodařilo se identifikovat)"
+    # Překlad a deduplikace (stabilní pořadí, původní třídy zůstávají v "labels")
+    translations = translate_many(unique_labels)
 
-        translated_labels.append(translated)
+    # Ošetření neznámých tříd
+    unique_translated = [
+        entry["translated"] if entry["known"] else entry["translated"] + " (nepodařilo se identifikovat)"
+        for entry in translations
+    ]
 
-    # Odstranění duplicit po překladu
-    unique_translated = list(set(translated_labels))
+    # Příběhy pro první třídy začneme generovat na pozadí, než si uživatel vybere
+    if not st.session_state.prefetch_started:
+        try:
+            prefetch_provider = build_llm_router().order()[0]
+            async_llm = get_llm(prefetch_provider, api_key_per if prefetch_provider == "Perplexity" else api_key_openai, use_async=True)
+            prefetch_topics = [label.split("(")[0].strip() for label in unique_translated]
+            st.session_state.prefetcher.start(async_llm, prefetch_provider, prefetch_topics, PromptBuilder(), STORY_TEMPERATURE)
+        except Exception:
+            # Prefetch je jen optimalizace, při chybě se příběh vygeneruje až na kliknutí
+            pass
+        st.session_state.prefetch_started = True
 
     st.write("Tady je seznam toho, co **Mask2Former** na obrázku rozpoznal. Vyber si jednu z položek v nabídce níže \
              a profesor **Bagrstein** ti o ní poví její evoluční příběh.")
@@ -136,10 +215,9 @@ if st.session_state.labels:
     # Tlačítko pro generování
     if st.button("Zavolej profesora"):
         progress_text = "Už to kopu, vydrž... \U0001F69C"
-        my_bar = st.progress(0, text=progress_text)
-        for percent_complete in range(100):
-            time.sleep(0.01)
-            my_bar.progress(percent_complete + 1, text=progress_text)
+        my_bar = st.empty()
+        my_bar.caption(progress_text)
+        trace = metrics.start_trace("Zavolej profesora")
 
         try:
             # Získat vstup od uživatele
@@ -152,21 +230,47 @@ if st.session_state.labels:
             builder = PromptBuilder()
             prompt = builder.build(selected_topic)
 
-            # Volání LLM
-            if model_choice == "Perplexity":
-                llm_model = llm.PerplexityLLM(api_key=api_key_per)
+            # Volání LLM přes router (preferovaný / nejrychlejší poskytovatel s failoverem)
+            llm_router = build_llm_router()
+            provider = llm_router.order()[0]
+            llm_model = llm_router.providers[provider]
+
+            # Nejdřív cache - stejná témata se opakují
+            cache_key = story_cache.story_key(provider, llm_model.model, selected_topic, STORY_TEMPERATURE, builder)
+            # Zaseknutý prefetch nesmí blokovat kliknutí - po krátkém čekání se zruší a příběh se streamuje
+            cached_story = st.session_state.prefetcher.result(cache_key, timeout=config.PREFETCH_WAIT)
+            if cached_story is None:
+                cached_story = story_cache.story_cache.get(cache_key)
+            if cached_story is not None:
+                my_bar.empty()
+                st.write(cached_story)
             else:
-                llm_model = llm.OpenAILLM(api_key=api_key_openai)
-            generated_text = llm_model.generate(prompt)
-
-
-            # Zobrazení výsledku
-            st.write(generated_text)
+                def stream_story():
+                    # Zobrazení výsledku průběžně, jak přicházejí části textu
+                    chunks = llm_router.generate_stream(prompt, temperature=STORY_TEMPERATURE)
+                    first_chunk = next(chunks, "")
+                    my_bar.empty()
+                    generated_text = st.write_stream(itertools.chain([first_chunk], chunks))
+                    if isinstance(generated_text, str):
+                        # Příběh ukládáme pod poskytovatele, který ho skutečně vygeneroval
+                        used_model = llm_router.providers[llm_router.last_provider]
+                        used_key = story_cache.story_key(llm_router.last_provider, used_model.model, selected_topic, STORY_TEMPERATURE, builder)
+                        story_cache.story_cache.add(used_key, generated_text)
+                    return generated_text
+
+                # Stejný příběh právě generuje jiná session - počkáme na něj místo dalšího volání API
+                with admission.session(st.session_state.session_id, show_queue_position(my_bar)):
+                    flight_key = story_cache.story_flight_key(cache_key, *(model.api_key for model in llm_router.providers.values()))
+                    generated_text, shared = story_cache.story_flights.do(flight_key, stream_story)
+                if shared:
+                    my_bar.empty()
+                    st.write(generated_text)
 
         except Exception as e:
             st.error(f"Chyba při generování: {str(e)}")
 
         my_bar.empty()
+        st.session_state.last_trace = metrics.finish_trace(trace)
 
         st.markdown('<span style="font-size: 15px;"><br><br>---------------------------------------------------------------\
                     ---------------------------------------------------------------------------------------<br>\
@@ -180,6 +284,19 @@ if st.session_state.segment_attempt:
              Však to znáš z Windows. \U0001F926")
 
 
+# Ladicí panel s časy fází posledního požadavku
+if metrics.is_enabled() and st.sidebar.checkbox("Ladicí panel (časy fází)", value=False, key="debug_panel"):
+    last_trace = st.session_state.get("last_trace")
+    if last_trace is None or not last_trace.spans:
+        st.sidebar.caption("Zatím žádný změřený požadavek.")
+    else:
+        st.sidebar.markdown(f"**{last_trace.name}**")
+        st.sidebar.table([
+            {"fáze": name, "ms": round(duration * 1000, 1), "detail": ", ".join(f"{k}={v}" for k, v in attrs.items())}
+            for name, duration, attrs in last_trace.spans
+        ])
+
+
 # Tlačítko pro resetování
 if st.sidebar.button("Reset"):
     st.session_state.labels = []
@@ -187,7 +304,12 @@ if st.sidebar.button("Reset"):
     st.session_state.show_original = True
     st.session_state.segment_attempt = False
     st.session_state.segmented_image = None
+    session_store.store.drop(st.session_state.session_id)
     st.session_state.show_segment_button = True
+    st.session_state.prefetcher.cancel()
+    st.session_state.prefetch_started = False
     st.rerun()
 
 
+# Načtení těžších knihoven na pozadí (jednou za proces, až po vykreslení stránky)
+warm_start()
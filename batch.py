@@ -0,0 +1,188 @@
+"""
+Batch (headless) zpracování celé složky obrázků bez Streamlitu.
+
+Pipeline pro každý obrázek:
+    process_image -> fetch_segments -> render_segments -> PromptBuilder -> LLM
+Výsledky se zapisují do výstupní složky: overlays/*.png a results.jsonl
+(jeden JSON záznam na obrázek). Už zpracované obrázky se při dalším běhu přeskočí.
+
+Příklad:
+    python batch.py obrazky/ -o vystup/ --provider perplexity --stories 3
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import config
+from models import llm, segmentation, story_cache
+from utils import admission, image_utils, transport
+from utils.coco_class_map import preprocess_class_name, translate_many
+from utils.prompt_utils import PromptBuilder
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+RESULTS_FILE = "results.jsonl"
+OVERLAY_DIR = "overlays"
+
+
+def list_images(source):
+    """Seznam obrázků ze složky, nebo z manifestu (řádek = cesta, případně JSONL s klíčem "image")"""
+    source = Path(source)
+    if source.is_dir():
+        return sorted(str(p) for p in source.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+
+    images = []
+    for line in source.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        path = json.loads(line)["image"] if line.startswith("{") else line
+        # Relativní cesty v manifestu se berou vůči jeho složce
+        if not os.path.isabs(path):
+            path = str(source.parent / path)
+        images.append(path)
+    return images
+
+
+def load_checkpoint(results_path):
+    """Vrátí množinu obrázků, které už mají úspěšný záznam v results.jsonl"""
+    done = set()
+    if not results_path.exists():
+        return done
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Poslední řádek mohl zůstat nedopsaný po přerušení
+                continue
+            if not record.get("error"):
+                done.add(record["image"])
+    return done
+
+
+def overlay_name(image_path):
+    """Unikátní název overlaye (stejné názvy souborů v různých podsložkách se nepřepíšou)"""
+    digest = hashlib.sha1(image_path.encode("utf-8")).hexdigest()[:8]
+    return f"{Path(image_path).stem}-{digest}.png"
+
+
+def _ingest(image_path, max_size):
+    """CPU fáze (process pool): načtení a zmenšení obrázku"""
+    return image_utils.process_image_bytes(Path(image_path).read_bytes(), max_size)
+
+
+def _render(pil_img, segments, overlay_path):
+    """CPU fáze (process pool): vykreslení masek a uložení overlaye"""
+    overlay = segmentation.render_segments(pil_img, segments)
+    overlay.save(overlay_path, format="PNG")
+    return overlay_path
+
+
+def make_llm(provider, args):
+    if provider == "perplexity":
+        return llm.PerplexityLLM(api_key=args.per_token)
+    return llm.OpenAILLM(api_key=args.openai_token)
+
+
+def process_one(image_path, args, cpu_pool, output_dir):
+    """Celá pipeline pro jeden obrázek. Síťové fáze běží ve vlákně, CPU fáze v process poolu."""
+    record = {"image": image_path}
+    # Každý obrázek má vlastní frontu v admission: souběžné obrázky a jejich dlaždice se střídají
+    # a nenarazí na limit čekajících požadavků jedné session
+    with admission.session(f"batch:{image_path}"):
+        try:
+            max_size = config.TILED_MAX_SIZE if args.tiled else 512
+            pil_img = cpu_pool.submit(_ingest, image_path, max_size).result()
+
+            if args.tiled:
+                segments = segmentation.fetch_segments_tiled(pil_img, args.hf_token)
+            else:
+                segments = segmentation.fetch_segments(pil_img, args.hf_token)
+            if segments.errors:
+                record["mask_errors"] = segments.errors
+
+            overlay_path = output_dir / OVERLAY_DIR / overlay_name(image_path)
+            cpu_pool.submit(_render, pil_img, segments, str(overlay_path)).result()
+            record["overlay"] = str(overlay_path.relative_to(output_dir))
+
+            # Třídy seřazené podle významnosti - příběhy (--stories N) se generují pro prvních N
+            labels = segmentation.rank_labels(segments)
+            record["labels"] = [{"label": label, "translated": preprocess_class_name(label)} for label in labels]
+            record["segments"] = [
+                {**stat, "centroid": [round(c, 1) for c in stat["centroid"]] if stat["centroid"] else None}
+                for stat in segments.stats()
+            ]
+
+            stories = {}
+            if args.provider != "none" and args.stories > 0:
+                llm_model = make_llm(args.provider, args)
+                builder = PromptBuilder()
+                topics = [entry["translated"] for entry in translate_many(labels)]
+                for topic in topics[:args.stories]:
+                    stories[topic] = story_cache.generate_story(llm_model, args.provider, topic, builder)
+            record["stories"] = stories
+
+        except Exception as e:
+            record["error"] = str(e)
+    return record
+
+
+def run(args):
+    output_dir = Path(args.output)
+    (output_dir / OVERLAY_DIR).mkdir(parents=True, exist_ok=True)
+    results_path = output_dir / RESULTS_FILE
+
+    images = list_images(args.input)
+    done = load_checkpoint(results_path) if not args.no_resume else set()
+    pending = [image for image in images if image not in done]
+    print(f"Obrázků: {len(images)}, hotovo z minula: {len(images) - len(pending)}, ke zpracování: {len(pending)}")
+
+    write_lock = threading.Lock()
+    failed = 0
+    # Ne fork: proces už běží s vlákny (metriky, dekódování masek) a potomek by mohl zdědit jejich
+    # zamčené zámky
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=args.cpu_workers, mp_context=multiprocessing.get_context(start_method)) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=args.network_workers) as network_pool, \
+            open(results_path, "a", encoding="utf-8") as results_file:
+        futures = [network_pool.submit(process_one, image, args, cpu_pool, output_dir) for image in pending]
+        for i, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            if record.get("error"):
+                failed += 1
+            # Zápis po každém obrázku = checkpoint pro navázání po přerušení
+            with write_lock:
+                results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                results_file.flush()
+            status = "CHYBA " + record["error"] if record.get("error") else "ok"
+            print(f"[{i}/{len(pending)}] {record['image']}: {status}")
+
+    transport.close_all()
+    return failed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch segmentace a generování příběhů pro složku obrázků")
+    parser.add_argument("input", help="Složka s obrázky, nebo manifest (seznam cest / JSONL s klíčem 'image')")
+    parser.add_argument("-o", "--output", required=True, help="Výstupní složka")
+    parser.add_argument("--provider", choices=["perplexity", "openai", "none"], default="perplexity",
+                        help="Poskytovatel LLM pro příběhy ('none' = jen segmentace)")
+    parser.add_argument("--stories", type=int, default=3, help="Počet příběhů na obrázek (nejvýznamnější třídy: plocha × skóre)")
+    parser.add_argument("--network-workers", type=int, default=4, help="Max. souběžných síťových požadavků")
+    parser.add_argument("--cpu-workers", type=int, default=os.cpu_count(), help="Velikost process poolu pro CPU fáze")
+    parser.add_argument("--tiled", action="store_true", help="Segmentace po dlaždicích v plném rozlišení")
+    parser.add_argument("--no-resume", action="store_true", help="Ignorovat existující results.jsonl")
+    parser.add_argument("--hf-token", default=os.getenv("HF_API_TOKEN") or config.HF_API_TOKEN)
+    parser.add_argument("--per-token", default=os.getenv("PER_API_TOKEN") or config.PER_API_TOKEN)
+    parser.add_argument("--openai-token", default=os.getenv("OPENAI_API_KEY") or config.OPENAI_API_KEY)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run(parse_args()) else 0)
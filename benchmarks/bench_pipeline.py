@@ -0,0 +1,241 @@
+"""
+Reprodukovatelný benchmark obrazové a vykreslovací pipeline (bez sítě).
+
+Používá syntetické obrázky několika velikostí a syntetické panoptické odpovědi
+s 1-100 segmenty. Pro každou fázi měří latenci (p50/p95/p99), propustnost a špičku paměti:
+nárůst RSS procesu (včetně alokací Pillow a NumPy v C) a zvlášť jen Python heap (tracemalloc).
+
+Příklad (spouštět z kořene repozitáře):
+    python -m benchmarks.bench_pipeline --output bench.json
+    python -m benchmarks.bench_pipeline --baseline bench.json --threshold 0.2
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from models import segmentation
+from models.backends import synthetic_panoptic_response
+from utils import image_utils, metrics
+from utils.coco_class_map import COCO_CLASS_TRANSLATION, preprocess_class_name
+
+IMAGE_SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+SEGMENT_COUNTS = [1, 10, 30, 100]
+# Velikost obrázku, který jde do API (process_image zmenšuje na 512 px)
+API_SIZE = (512, 384)
+# ru_maxrss je na macOS v bajtech, jinde v KB
+RU_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def _load_malloc_trim():
+    """glibc malloc_trim (jinde None)"""
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c")).malloc_trim
+    except (OSError, AttributeError, TypeError):
+        return None
+
+
+_malloc_trim = _load_malloc_trim()
+
+
+def synthetic_jpeg(size, seed=0):
+    """JPEG s plynulými přechody a šumem (realističtější komprese než čistý šum)"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:height, 0:width]
+    base = np.stack([xs * 255 // max(width - 1, 1), ys * 255 // max(height - 1, 1), (xs + ys) % 256], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class _Upload:
+    """Náhrada za Streamlit UploadedFile"""
+    def __init__(self, data):
+        self._data = data
+
+    def getvalue(self):
+        return self._data
+
+
+def measure_rss(fn):
+    """
+    Nárůst špičky RSS (B) během jednoho běhu `fn`, nebo None bez fork/resource.
+
+    Běží ve forknutém potomkovi: jeho ru_maxrss začíná na aktuálním RSS rodiče, takže rozdíl
+    před a po běhu je špička právě této fáze - včetně bufferů Pillow a NumPy, které tracemalloc nevidí.
+    """
+    if resource is None or not hasattr(os, "fork"):
+        return None
+    # Uvolněnou, ale stále rezidentní paměť z předchozích běhů vrátíme systému, jinak by ji
+    # potomek znovu použil a nárůst RSS by nebyl vidět
+    if _malloc_trim is not None:
+        _malloc_trim(0)
+    read_fd, write_fd = os.pipe()
+    with warnings.catch_warnings():
+        # Vlákna poolu na dekódování masek si potomek zakládá znovu (segmentation._reset_decode_pool)
+        warnings.simplefilter("ignore", DeprecationWarning)
+        pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            fn()
+            after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(write_fd, str((after - before) * RU_MAXRSS_UNIT).encode())
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return int(data) if data else None
+
+
+def measure(fn, repeat, warmup=1):
+    """Časy jednotlivých běhů (s), špička RSS (B) a špička Python heapu (B), obojí v samostatném běhu"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    peak_rss = measure_rss(fn)
+    tracemalloc.start()
+    fn()
+    _, peak_heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, peak_rss, peak_heap
+
+
+def summarize(timings, peak_rss, peak_heap, items=1):
+    timings = np.array(timings)
+    return {
+        "runs": len(timings),
+        "p50_ms": round(float(np.percentile(timings, 50)) * 1000, 4),
+        "p95_ms": round(float(np.percentile(timings, 95)) * 1000, 4),
+        "p99_ms": round(float(np.percentile(timings, 99)) * 1000, 4),
+        "throughput_per_s": round(items / float(np.median(timings)), 2),
+        "peak_rss_kb": round(peak_rss / 1024, 1) if peak_rss is not None else None,
+        "peak_py_heap_kb": round(peak_heap / 1024, 1),
+    }
+
+
+def build_cases(repeat):
+    """(název, funkce, počet položek na běh, počet opakování)"""
+    cases = []
+
+    for size in IMAGE_SIZES:
+        upload = _Upload(synthetic_jpeg(size))
+        cases.append((f"process_image/{size[0]}x{size[1]}", lambda u=upload: image_utils.process_image(u), 1, repeat))
+
+    base = Image.fromarray(np.zeros((API_SIZE[1], API_SIZE[0], 3), dtype=np.uint8))
+    for n in SEGMENT_COUNTS:
+        response = synthetic_panoptic_response(API_SIZE, n, seed=n)
+        masks_b64 = [segment["mask"] for segment in response]
+        label_map = segmentation.parse_segments(response, API_SIZE)
+        colors = segmentation.generate_distinct_colors(n)
+        bool_masks = [label_map.mask(i) for i in range(n)]
+
+        cases.append((f"decode_base64_mask/{n}", lambda m=masks_b64: [segmentation.decode_base64_mask(s) for s in m], n, repeat))
+        cases.append((f"parse_segments/{n}", lambda r=response: segmentation.parse_segments(r, API_SIZE), n, repeat))
+        cases.append((f"apply_colored_masks/{n}", lambda m=bool_masks, c=colors: segmentation.apply_colored_masks(base, m, c), n, repeat))
+        cases.append((f"segment_stats/{n}", lambda lm=label_map: lm.stats(), n, repeat))
+        cases.append((f"render_segments/{n}", lambda lm=label_map: segmentation.render_segments(base, lm), n, repeat))
+        cases.append((f"generate_distinct_colors/{n}", lambda n=n: segmentation.generate_distinct_colors(n), n, repeat * 10))
+
+    labels = list(COCO_CLASS_TRANSLATION) + [f"{label}-merged" for label in COCO_CLASS_TRANSLATION] + ["unknown-other-merged"]
+    cases.append(("preprocess_class_name/all", lambda: [preprocess_class_name(label) for label in labels], len(labels), repeat * 10))
+    return cases
+
+
+def run(repeat, only=None):
+    # Měří se samotné funkce, bez režie vlastní instrumentace a bez cache
+    metrics.set_enabled(False)
+    results = {}
+    for name, fn, items, runs in build_cases(repeat):
+        if only and not any(pattern in name for pattern in only):
+            continue
+        timings, peak_rss, peak_heap = measure(fn, runs)
+        results[name] = summarize(timings, peak_rss, peak_heap, items)
+        rss = f"{results[name]['peak_rss_kb']:10.1f} KB" if peak_rss is not None else f"{'-':>13s}"
+        print(f"{name:36s} p50 {results[name]['p50_ms']:10.3f} ms   p95 {results[name]['p95_ms']:10.3f} ms   "
+              f"{results[name]['throughput_per_s']:12.1f} /s   peak RSS {rss}   "
+              f"py heap {results[name]['peak_py_heap_kb']:10.1f} KB")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Vrátí seznam regresí: fáze, kde p50 vzrostl o víc než `threshold` (poměr) proti baseline"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous["p50_ms"]:
+            continue
+        ratio = current["p50_ms"] / previous["p50_ms"]
+        if ratio > 1 + threshold:
+            regressions.append((name, previous["p50_ms"], current["p50_ms"], ratio))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark obrazové a vykreslovací pipeline")
+    parser.add_argument("--repeat", type=int, default=20, help="Počet měřených běhů na fázi")
+    parser.add_argument("--only", nargs="*", help="Spustit jen fáze obsahující některý z řetězců")
+    parser.add_argument("--output", help="Uložit výsledky jako JSON")
+    parser.add_argument("--baseline", help="JSON s dřívějšími výsledky pro porovnání")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Povolené zhoršení p50 (0.2 = 20 %%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args.repeat, args.only)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "numpy": np.__version__,
+        "pillow": Image.__version__,
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESE {name}: {before:.3f} ms -> {after:.3f} ms ({(ratio - 1) * 100:+.0f} %)")
+        if regressions:
+            return 1
+        print("Bez regresí proti baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
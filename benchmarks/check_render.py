@@ -0,0 +1,101 @@
+"""
+Regresní kontrola vykreslování masek proti původní implementaci.
+
+apply_colored_masks skládá masky vektorově; výsledek musí být pixel po pixelu shodný
+s původní smyčkou getpixel/putpixel + Image.alpha_composite pro každou masku zvlášť.
+Kontroluje překrývající se masky, průhledné barvy (alfa 0), masky jiné velikosti
+než obrázek a vstup v RGB i RGBA. Příklad (spouštět z kořene repozitáře):
+    python -m benchmarks.check_render
+"""
+import sys
+
+import numpy as np
+from PIL import Image
+
+from models import segmentation
+
+SIZE = (48, 32)
+
+
+def reference_colored_mask(image, mask_img, color=(255, 0, 0, 128)):
+    """Původní apply_colored_mask (pixel po pixelu)"""
+    img_rgba = image.convert("RGBA")
+    if mask_img.size != image.size:
+        mask_img = mask_img.resize(image.size)
+    colored_mask = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    mask_l = mask_img.convert("L")
+    for y in range(image.height):
+        for x in range(image.width):
+            if mask_l.getpixel((x, y)) > 128:
+                colored_mask.putpixel((x, y), color)
+    return Image.alpha_composite(img_rgba, colored_mask)
+
+
+def reference_colored_masks(image, mask_imgs, colors):
+    result = image
+    for mask_img, color in zip(mask_imgs, colors):
+        result = reference_colored_mask(result, mask_img, color)
+    return result.convert("RGBA")
+
+
+def random_image(rng, mode):
+    channels = 4 if mode == "RGBA" else 3
+    pixels = rng.integers(0, 256, (SIZE[1], SIZE[0], channels), dtype=np.uint8)
+    return Image.fromarray(pixels, mode)
+
+
+def random_mask(rng, size=SIZE, density=0.4):
+    pixels = np.where(rng.random((size[1], size[0])) < density, 255, 0).astype(np.uint8)
+    return Image.fromarray(pixels, "L")
+
+
+def random_color(rng, alpha=None):
+    return tuple(int(c) for c in rng.integers(0, 256, 3)) + (int(rng.integers(0, 256)) if alpha is None else alpha,)
+
+
+def build_cases(seed=0):
+    """(název, obrázek, masky, barvy)"""
+    rng = np.random.default_rng(seed)
+    cases = []
+    for mode in ("RGB", "RGBA"):
+        # Husté náhodné masky se hojně překrývají
+        masks = [random_mask(rng) for _ in range(6)]
+        cases.append((f"overlap/{mode}", random_image(rng, mode), masks, [random_color(rng) for _ in masks]))
+
+        # Disjunktní masky (panoptická segmentace) s distinct barvami jako v render_segments
+        labels = rng.integers(0, 8, (SIZE[1], SIZE[0]))
+        masks = [Image.fromarray(np.where(labels == i, 255, 0).astype(np.uint8), "L") for i in range(8)]
+        cases.append((f"disjoint/{mode}", random_image(rng, mode), masks, segmentation.generate_distinct_colors(8)))
+
+        masks = [random_mask(rng) for _ in range(3)]
+        colors = [random_color(rng, alpha=0), random_color(rng, alpha=255), random_color(rng, alpha=0)]
+        cases.append((f"alpha/{mode}", random_image(rng, mode), masks, colors))
+
+        masks = [random_mask(rng, size=(24, 16)), random_mask(rng, size=(96, 64)), random_mask(rng)]
+        cases.append((f"resize/{mode}", random_image(rng, mode), masks, [random_color(rng) for _ in masks]))
+
+    cases.append(("empty", random_image(rng, "RGB"), [], []))
+    return cases
+
+
+def run(seed=0):
+    """Vrátí seznam názvů případů, kde se výstup liší od původní implementace"""
+    failures = []
+    for name, image, masks, colors in build_cases(seed):
+        expected = np.asarray(reference_colored_masks(image, masks, colors))
+        actual = np.asarray(segmentation.apply_colored_masks(image, masks, colors))
+        ok = actual.shape == expected.shape and np.array_equal(actual, expected)
+        if masks:
+            single = np.asarray(segmentation.apply_colored_mask(image, masks[0], colors[0]))
+            ok = ok and np.array_equal(single, np.asarray(reference_colored_mask(image, masks[0], colors[0])))
+        print(f"{name:20s} {'ok' if ok else 'ROZDÍL'}")
+        if not ok:
+            failures.append(name)
+    return failures
+
+
+if __name__ == "__main__":
+    failures = run()
+    if failures:
+        print(f"Výstup se liší od původní implementace: {', '.join(failures)}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,95 @@
+"""
+Profil importů aplikace (python -X importtime) - co zdržuje studený start kontejneru.
+
+Spustí v čistém podprocesu import zadaných modulů a vypíše moduly s nejdelším
+kumulativním časem importu. Příklad (spouštět z kořene repozitáře):
+    python -m benchmarks.import_profile
+    python -m benchmarks.import_profile --modules models.llm --top 15 --output imports.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Moduly, které app.py načítá při startu
+APP_MODULES = [
+    "streamlit",
+    "utils.image_utils",
+    "models.llm",
+    "models.segmentation",
+    "models.story_cache",
+    "models.prefetch",
+    "models.router",
+    "utils.metrics",
+    "utils.session_store",
+    "utils.prompt_utils",
+    "utils.coco_class_map",
+]
+
+# Těžké SDK poskytovatelů - při startu by se načítat neměly
+PROVIDER_SDKS = ["openai", "transformers", "torch"]
+
+
+def parse_importtime(stderr):
+    """Řádky `import time: self [us] | cumulative | imported package` -> seznam záznamů"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return entries
+
+
+def profile(modules):
+    """Import modulů v novém interpretu; vrací (záznamy importtime, celkový čas v ms)"""
+    code = "; ".join(f"import {module}" for module in modules)
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=env,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"Import selhal:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr), wall_ms
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Profil importů aplikace")
+    parser.add_argument("--modules", nargs="*", default=APP_MODULES, help="Moduly k importu")
+    parser.add_argument("--top", type=int, default=25, help="Kolik nejpomalejších modulů vypsat")
+    parser.add_argument("--output", help="Uložit všechny záznamy jako JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    entries, wall_ms = profile(args.modules)
+
+    print(f"Celkem {wall_ms:.0f} ms (včetně startu interpretu), {len(entries)} modulů\n")
+    print(f"{'kumulativně ms':>15} {'vlastní ms':>11}  modul")
+    for entry in sorted(entries, key=lambda e: e["cumulative_ms"], reverse=True)[:args.top]:
+        print(f"{entry['cumulative_ms']:15.1f} {entry['self_ms']:11.1f}  {'  ' * entry['depth']}{entry['module']}")
+
+    loaded = {entry["module"] for entry in entries}
+    eager_sdks = [sdk for sdk in PROVIDER_SDKS if sdk in loaded]
+    if eager_sdks:
+        print(f"\nPOZOR: při startu se načítají SDK poskytovatelů: {', '.join(eager_sdks)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"modules": args.modules, "wall_ms": wall_ms, "imports": entries}, f, indent=2)
+    return 1 if eager_sdks else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
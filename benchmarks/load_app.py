@@ -0,0 +1,597 @@
+"""
+Zátěžový test Streamlit aplikace se souběžnými sessions (kapacitní plánování před vydáním).
+
+Spustí skutečný `streamlit run app.py` (jeden nebo více procesů) proti lokálním zástupným
+serverům za segmentační a LLM API (stub_server.py s nastavitelnou latencí a chybovostí)
+a každou session provede celým tokem aplikace jako uživatel v prohlížeči: načtení stránky,
+nahrání obrázku, Segmentovat, výběr třídy, Zavolej profesora. Klient mluví se Streamlitem
+přes jeho websocket protokol (stejné protobuf zprávy jako frontend), potřebuje balíček
+websockets (instaluje se se Streamlitem) a protokol odpovídá Streamlitu 1.4x+.
+
+Vypíše propustnost (dokončené toky za sekundu), percentily latence jednotlivých kroků,
+chyby a pro každý proces RSS (na začátku, špička, po dokončení sessions) a spotřebu CPU.
+RSS a CPU se čtou z /proc (Linux), případně přes psutil, pokud je nainstalovaný.
+
+Limity admission (token buckety na poskytovatele) se ve výchozím stavu vypínají, jinak by naměřená
+propustnost byla jen strop z config.ADMISSION_LIMITS. `--admission-limits production` ponechá limity
+z configu, JSON hodnota nastaví vlastní (stejný formát jako ADMISSION_LIMITS).
+
+Příklad (spouštět z kořene repozitáře):
+    python -m benchmarks.load_app --sessions 50
+    python -m benchmarks.load_app --sessions 500 --concurrency 100 --servers 2 \\
+        --seg-latency 800 --llm-latency 400 --chunk-delay 30 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.bench_pipeline import synthetic_jpeg
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = ROOT / "app.py"
+STUB_PATH = ROOT / "stub_server.py"
+
+# Kroky jednoho toku v pořadí, v jakém je dělá uživatel
+STEPS = ["nacteni", "nahrani", "segmentace", "vyber", "pribeh"]
+
+SEGMENT_BUTTON = "Segmentovat"
+STORY_BUTTON = "Zavolej profesora"
+HF_KEY_LABEL = "HuggingFace API klíč"
+LLM_KEY_LABELS = {"Perplexity": "Perplexity API klíč", "OpenAI": "nebo OpenAI API klíč"}
+
+
+class FlowError(Exception):
+    """Krok toku selhal (chyba v aplikaci, chybějící prvek stránky, vypršený čas)"""
+
+
+# Měření procesů
+
+def _proc_sample(pid):
+    """(RSS v bajtech, CPU v sekundách) procesu - přes psutil, jinak z /proc; None když nejde"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    try:
+        if psutil is not None:
+            process = psutil.Process(pid)
+            times = process.cpu_times()
+            return process.memory_info().rss, times.user + times.system
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        with open(f"/proc/{pid}/stat") as f:
+            # Název procesu může obsahovat mezery - pole se počítají od konce závorky
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        return rss_pages * os.sysconf("SC_PAGE_SIZE"), (int(fields[11]) + int(fields[12])) / ticks
+    except Exception:
+        return None
+
+
+class ProcessMonitor:
+    """Vzorkuje RSS a CPU sledovaných procesů v samostatném vlákně"""
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self._pids = {}
+        self._samples = {}
+        self._marks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="process-monitor", daemon=True)
+
+    def watch(self, name, pid):
+        with self._lock:
+            self._pids[name] = pid
+            self._samples[name] = []
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        with self._lock:
+            for name, pid in self._pids.items():
+                sample = _proc_sample(pid)
+                if sample is not None:
+                    self._samples[name].append((time.monotonic(), *sample))
+
+    def mark(self, label):
+        """Okamžitý vzorek všech procesů pod jménem (např. "start", "po_sessions")"""
+        self.sample()
+        with self._lock:
+            self._marks[label] = {name: samples[-1] for name, samples in self._samples.items() if samples}
+
+    def report(self, start_label, end_label):
+        """Pro každý proces RSS v MB (značky a špička mezi nimi) a CPU za stejný úsek"""
+        report = {}
+        with self._lock:
+            for name, samples in self._samples.items():
+                start = self._marks.get(start_label, {}).get(name)
+                end = self._marks.get(end_label, {}).get(name)
+                if start is None or end is None:
+                    report[name] = None
+                    continue
+                window = [s for s in samples if start[0] <= s[0] <= end[0]] or [start, end]
+                elapsed = max(end[0] - start[0], 1e-9)
+                report[name] = {
+                    "pid": self._pids[name],
+                    "rss_start_mb": round(start[1] / 2**20, 1),
+                    "rss_peak_mb": round(max(s[1] for s in window) / 2**20, 1),
+                    "rss_end_mb": round(end[1] / 2**20, 1),
+                    "cpu_s": round(end[2] - start[2], 2),
+                    "cpu_percent": round((end[2] - start[2]) / elapsed * 100, 1),
+                }
+                for label, marks in self._marks.items():
+                    if label not in (start_label, end_label) and name in marks:
+                        report[name][f"rss_{label}_mb"] = round(marks[name][1] / 2**20, 1)
+        return report
+
+
+# Spouštění serverů
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(url, timeout=60, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Proces pro {url} skončil s kódem {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} nenaběhl do {timeout} s")
+
+
+def start_stub(port, latency, jitter, error_rate, extra, log):
+    command = [
+        sys.executable, str(STUB_PATH), "--port", str(port), "--quiet",
+        "--latency", str(latency), "--jitter", str(jitter), "--error-rate", str(error_rate), *extra,
+    ]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    wait_until_ready(f"http://127.0.0.1:{port}/health", process=process)
+    return process
+
+
+def start_app_server(port, env, workdir, log):
+    """`streamlit run app.py` bez prohlížeče; pracovní adresář = čerstvé cache pro každý běh"""
+    command = [
+        sys.executable, "-m", "streamlit", "run", str(APP_PATH),
+        "--server.port", str(port),
+        "--server.address", "127.0.0.1",
+        "--server.headless", "true",
+        "--server.enableXsrfProtection", "false",
+        "--server.enableCORS", "false",
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ]
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    wait_until_ready(f"http://127.0.0.1:{port}/_stcore/health", timeout=120, process=process)
+    return process
+
+
+# Klient Streamlit session
+
+class AppSession:
+    """
+    Jedna session aplikace přes websocket /_stcore/stream - posílá rerun se stavem widgetů
+    (jako frontend po kliknutí) a čte vykreslené prvky až do konce běhu skriptu.
+    """
+    def __init__(self, base_url, step_timeout):
+        self.base_url = base_url
+        self.step_timeout = step_timeout
+        self.ws = None
+        self.session_id = None
+        self.page_script_hash = ""
+        # id widgetu -> WidgetState, který se posílá s každým rerunem (hodnoty, které "uživatel" zadal)
+        self.values = {}
+        self.widgets = {}
+        self.errors = []
+
+    async def connect(self):
+        try:
+            from websockets.asyncio.client import connect
+        except ImportError as e:
+            raise ImportError("Zátěžový test vyžaduje balíček websockets (pip install websockets)") from e
+        ws_url = self.base_url.replace("http://", "ws://") + "/_stcore/stream"
+        self.ws = await connect(ws_url, subprotocols=["streamlit"], max_size=None, open_timeout=self.step_timeout)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, trigger_id=None):
+        """Rerun skriptu se zadanými hodnotami widgetů (a případně stisknutým tlačítkem)"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.page_script_hash = self.page_script_hash
+        message.rerun_script.widget_states.widgets.extend(self.values.values())
+        if trigger_id is not None:
+            message.rerun_script.widget_states.widgets.append(WidgetState(id=trigger_id, trigger_value=True))
+        self.widgets = {}
+        self.errors = []
+        await self.ws.send(message.SerializeToString())
+        await asyncio.wait_for(self._read_run(), self.step_timeout)
+        if self.errors:
+            raise FlowError(self.errors[0])
+
+    async def _read_run(self):
+        from streamlit.proto.Alert_pb2 import Alert
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await self.ws.recv())
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.session_id = msg.new_session.initialize.session_id
+                self.page_script_hash = msg.new_session.page_script_hash
+                # st.rerun() začíná nový běh - prvky z přerušeného běhu neplatí
+                self.widgets = {}
+                self.errors = []
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "alert" and element.alert.format == Alert.ERROR:
+                    self.errors.append(element.alert.body)
+                elif element_type == "exception":
+                    self.errors.append(f"{element.exception.type}: {element.exception.message}")
+                elif element_type in ("button", "text_input", "file_uploader", "selectbox"):
+                    widget = getattr(element, element_type)
+                    self.widgets[(element_type, widget.label)] = widget
+            elif kind == "script_finished":
+                if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return
+
+    def widget(self, element_type, label=None):
+        for (kind, widget_label), widget in self.widgets.items():
+            if kind == element_type and (label is None or widget_label == label):
+                return widget
+        raise FlowError(f"Na stránce chybí {element_type} {label or ''}".strip())
+
+    def set_text(self, label, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widget_id = self.widget("text_input", label).id
+        self.values[widget_id] = WidgetState(id=widget_id, string_value=value)
+
+    def select(self, index):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widget = self.widget("selectbox")
+        if not widget.options:
+            raise FlowError("Segmentace nevrátila žádné třídy")
+        option = widget.options[min(index, len(widget.options) - 1)]
+        self.values[widget.id] = WidgetState(id=widget.id, string_value=option)
+
+    async def upload(self, name, data, content_type="image/jpeg"):
+        """Nahraje soubor jako frontend (PUT na upload endpoint) a nastaví stav file_uploaderu"""
+        import requests
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widget_id = self.widget("file_uploader").id
+        file_id = uuid.uuid4().hex
+        url = f"{self.base_url}/_stcore/upload_file/{self.session_id}/{file_id}"
+        response = await asyncio.to_thread(
+            requests.put, url, files={"file": (name, data, content_type)}, timeout=self.step_timeout
+        )
+        if response.status_code >= 300:
+            raise FlowError(f"Nahrání souboru selhalo: {response.status_code} {response.text[:200]}")
+
+        state = WidgetState(id=widget_id)
+        info = state.file_uploader_state_value.uploaded_file_info.add()
+        info.file_id = file_id
+        info.name = name
+        info.size = len(data)
+        info.file_urls.file_id = file_id
+        info.file_urls.upload_url = url
+        info.file_urls.delete_url = url
+        self.values[widget_id] = state
+
+
+async def run_flow(base_url, image, index, options):
+    """Jeden uživatel celým tokem aplikace; vrací časy kroků (s) a případnou chybu"""
+    timings = {}
+    session = AppSession(base_url, options.step_timeout)
+    step = STEPS[0]
+
+    async def timed(name, action):
+        nonlocal step
+        step = name
+        start = time.perf_counter()
+        await action()
+        timings[name] = time.perf_counter() - start
+        if options.think_time:
+            await asyncio.sleep(options.think_time / 1000)
+
+    async def load():
+        await session.connect()
+        await session.rerun()
+
+    async def upload():
+        # Stuby klíče nekontrolují - vyplní se jen, aby aplikace poskytovatele použila
+        session.set_text(HF_KEY_LABEL, "stub")
+        for provider, label in LLM_KEY_LABELS.items():
+            session.set_text(label, "stub" if provider == options.provider else "")
+        await session.upload(f"load-{index}.jpg", image)
+        await session.rerun()
+
+    async def segment():
+        await session.rerun(session.widget("button", SEGMENT_BUTTON).id)
+
+    async def select():
+        session.select(index % 3)
+        await session.rerun()
+
+    async def story():
+        await session.rerun(session.widget("button", STORY_BUTTON).id)
+
+    try:
+        for name, action in zip(STEPS, (load, upload, segment, select, story)):
+            await timed(name, action)
+        return {"timings": timings, "error": None, "session": session}
+    except asyncio.TimeoutError:
+        return {"timings": timings, "error": f"{step}: vypršel čas ({options.step_timeout} s)", "session": session}
+    except Exception as e:
+        return {"timings": timings, "error": f"{step}: {str(e).splitlines()[0] if str(e) else type(e).__name__}", "session": session}
+
+
+async def run_load(base_urls, images, options, monitor):
+    semaphore = asyncio.Semaphore(options.concurrency)
+    results = []
+
+    async def one(index):
+        # Postupný nájezd - ne všichni uživatelé kliknou ve stejnou milisekundu
+        if options.ramp_up:
+            await asyncio.sleep(options.ramp_up * index / max(options.sessions, 1))
+        async with semaphore:
+            start = time.perf_counter()
+            result = await run_flow(base_urls[index % len(base_urls)], images[index % len(images)], index, options)
+            result["total"] = time.perf_counter() - start
+            if not options.hold:
+                await result.pop("session").close()
+            results.append(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(options.sessions)))
+    wall = time.perf_counter() - start
+
+    # Otevřené sessions drží session_state - RSS teď ukazuje paměť na živé uživatele
+    monitor.mark("po_sessions")
+    sessions = [result.pop("session") for result in results if "session" in result]
+    await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+    return results, wall
+
+
+# Výsledky
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.array(values) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p95_ms": round(float(np.percentile(values, 95)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1),
+        "max_ms": round(float(values.max()), 1),
+    }
+
+
+def summarize(results, wall):
+    completed = [r for r in results if r["error"] is None]
+    errors = {}
+    for result in results:
+        if result["error"] is not None:
+            errors[result["error"]] = errors.get(result["error"], 0) + 1
+    return {
+        "sessions": len(results),
+        "completed": len(completed),
+        "error_rate": round(1 - len(completed) / max(len(results), 1), 4),
+        "wall_s": round(wall, 2),
+        "throughput_per_s": round(len(completed) / wall, 3) if wall else None,
+        "steps": {step: percentiles([r["timings"][step] for r in results if step in r["timings"]]) for step in STEPS},
+        "flow": percentiles([r["total"] for r in completed]),
+        "errors": dict(sorted(errors.items(), key=lambda item: -item[1])),
+    }
+
+
+def print_report(summary, processes):
+    print(f"\nSessions {summary['sessions']}, dokončeno {summary['completed']} "
+          f"(chybovost {summary['error_rate'] * 100:.1f} %) za {summary['wall_s']} s "
+          f"-> {summary['throughput_per_s']} toků/s\n")
+    print(f"{'krok':12s} {'počet':>6s} {'p50 ms':>10s} {'p95 ms':>10s} {'p99 ms':>10s} {'max ms':>10s}")
+    for name, stats in [*summary["steps"].items(), ("celý tok", summary["flow"])]:
+        if stats:
+            print(f"{name:12s} {stats['count']:6d} {stats['p50_ms']:10.1f} {stats['p95_ms']:10.1f} "
+                  f"{stats['p99_ms']:10.1f} {stats['max_ms']:10.1f}")
+
+    print(f"\n{'proces':14s} {'RSS start MB':>13s} {'špička MB':>10s} {'se sessions':>12s} {'konec MB':>9s} {'CPU s':>7s} {'CPU %':>7s}")
+    for name, stats in processes.items():
+        if stats is None:
+            print(f"{name:14s} (RSS nelze změřit)")
+            continue
+        print(f"{name:14s} {stats['rss_start_mb']:13.1f} {stats['rss_peak_mb']:10.1f} "
+              f"{stats.get('rss_po_sessions_mb', stats['rss_end_mb']):12.1f} {stats['rss_end_mb']:9.1f} "
+              f"{stats['cpu_s']:7.1f} {stats['cpu_percent']:7.1f}")
+
+    if summary["errors"]:
+        print("\nChyby:")
+        for error, count in summary["errors"].items():
+            print(f"{count:6d}x {error}")
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def parse_admission_limits(text):
+    """'off' -> "{}" (bez limitů), 'production' beze změny, jinak ověřený JSON pro ADMISSION_LIMITS"""
+    if text == "off":
+        return "{}"
+    if text == "production":
+        return text
+    try:
+        limits = json.loads(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"neplatný JSON: {e}")
+    if not isinstance(limits, dict):
+        raise argparse.ArgumentTypeError("očekává se JSON objekt {poskytovatel: limity}")
+    return json.dumps(limits)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Zátěžový test aplikace se souběžnými sessions")
+    parser.add_argument("--sessions", type=int, default=50, help="Celkový počet uživatelů (toků)")
+    parser.add_argument("--concurrency", type=int, help="Nejvýš souběžných sessions (výchozí = --sessions)")
+    parser.add_argument("--ramp-up", type=float, default=0, help="Za kolik sekund se postupně připojí všichni uživatelé")
+    parser.add_argument("--think-time", type=float, default=0, help="Pauza uživatele mezi kroky v ms")
+    parser.add_argument("--servers", type=int, default=1, help="Počet procesů `streamlit run` (sessions se rozdělí střídavě)")
+    parser.add_argument("--no-hold", dest="hold", action="store_false",
+                        help="Zavírat session hned po dokončení toku (jinak se drží do konce měření)")
+    parser.add_argument("--image-size", type=parse_size, default=(1280, 960), help="Velikost nahrávaného obrázku, např. 1280x960")
+    parser.add_argument("--unique-images", type=int, default=0,
+                        help="Počet různých obrázků (0 = každá session jiný, 1 = všichni stejný a pomáhá cache)")
+    parser.add_argument("--step-timeout", type=float, default=180, help="Nejdelší povolená doba jednoho kroku v s")
+    parser.add_argument("--warmup", type=int, default=1, help="Toků před měřením (načtení knihoven v serveru)")
+    parser.add_argument("--provider", choices=["Perplexity", "OpenAI"], default="Perplexity",
+                        help="Poskytovatel LLM, kterému se vyplní API klíč")
+    parser.add_argument("--segments", type=int, default=8, help="Počet segmentů v odpovědi stubu")
+    parser.add_argument("--seg-latency", type=float, default=300, help="Latence segmentačního stubu v ms")
+    parser.add_argument("--seg-jitter", type=float, default=100)
+    parser.add_argument("--seg-error-rate", type=float, default=0)
+    parser.add_argument("--llm-latency", type=float, default=300, help="Latence LLM stubu do prvního chunku v ms")
+    parser.add_argument("--llm-jitter", type=float, default=100)
+    parser.add_argument("--llm-error-rate", type=float, default=0)
+    parser.add_argument("--story-words", type=int, default=120)
+    parser.add_argument("--chunk-delay", type=float, default=20, help="Prodleva mezi chunky příběhu v ms")
+    parser.add_argument("--admission-limits", type=parse_admission_limits, default="off",
+                        help="Limity admission v aplikaci: 'off' (výchozí), 'production' (z configu) nebo JSON")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Nad touto chybovostí skončí s kódem 1")
+    parser.add_argument("--output", help="Uložit výsledky jako JSON")
+    parser.add_argument("--keep-logs", action="store_true", help="Vypsat cestu k logům serverů a nemazat je")
+    args = parser.parse_args(argv)
+    args.concurrency = args.concurrency or args.sessions
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="segmenstory-load-")
+    log = open(os.path.join(workdir, "servers.log"), "wb")
+    processes = []
+    monitor = ProcessMonitor()
+    try:
+        seg_port, llm_port = free_port(), free_port()
+        processes.append(start_stub(seg_port, args.seg_latency, args.seg_jitter, args.seg_error_rate,
+                                    ["--segments", str(args.segments)], log))
+        processes.append(start_stub(llm_port, args.llm_latency, args.llm_jitter, args.llm_error_rate,
+                                    ["--story-words", str(args.story_words), "--chunk-delay", str(args.chunk_delay)], log))
+        monitor.watch("stub-segmentace", processes[0].pid)
+        monitor.watch("stub-llm", processes[1].pid)
+
+        env = {
+            **os.environ,
+            "SEGMENTATION_BACKEND": "local-http",
+            "SEGMENTATION_BACKEND_URL": f"http://127.0.0.1:{seg_port}/models/load-test",
+            "PERPLEXITY_BASE_URL": f"http://127.0.0.1:{llm_port}",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])),
+        }
+        if args.admission_limits != "production":
+            env["ADMISSION_LIMITS"] = args.admission_limits
+        base_urls = []
+        for i in range(args.servers):
+            port = free_port()
+            processes.append(start_app_server(port, env, workdir, log))
+            monitor.watch(f"streamlit-{i}", processes[-1].pid)
+            base_urls.append(f"http://127.0.0.1:{port}")
+        monitor.watch("zatez", os.getpid())
+        monitor.start()
+
+        count = args.unique_images or args.sessions
+        images = [synthetic_jpeg(args.image_size, seed=i) for i in range(count)]
+
+        if args.warmup:
+            warmup_args = argparse.Namespace(**{**vars(args), "sessions": args.warmup * len(base_urls),
+                                                "concurrency": len(base_urls), "ramp_up": 0, "think_time": 0})
+            warmup_images = [synthetic_jpeg(args.image_size, seed=count + i) for i in range(len(base_urls))]
+            warmup, _ = asyncio.run(run_load(base_urls, warmup_images, warmup_args, monitor))
+            failed = [r["error"] for r in warmup if r["error"]]
+            if failed:
+                print(f"POZOR: zahřívací tok selhal: {failed[0]}")
+
+        monitor.mark("start")
+        results, wall = asyncio.run(run_load(base_urls, images, args, monitor))
+        # Chvíle na uvolnění zavřených sessions a garbage collection v serverech
+        time.sleep(2)
+        monitor.mark("konec")
+        monitor.stop()
+
+        summary = summarize(results, wall)
+        process_report = monitor.report("start", "konec")
+        print_report(summary, process_report)
+
+        if args.output:
+            report = {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "options": {k: v for k, v in vars(args).items() if k not in ("output",)},
+                "summary": summary,
+                "processes": process_report,
+            }
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        return 1 if summary["error_rate"] > args.max_error_rate else 0
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        log.close()
+        if args.keep_logs:
+            print(f"\nLogy serverů: {log.name}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
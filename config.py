@@ -1,4 +1,124 @@
 # config.py (prázdný soubor pro GitHub) pro nasazení na Streamlit Cloud
+import json
+import os
+
 HF_API_TOKEN = ""
 PER_API_TOKEN = ""
 OPENAI_API_KEY = ""
+
+# Adresy LLM API - lze přesměrovat např. na stub_server.py při zátěžových testech
+# (prázdné OPENAI_BASE_URL = výchozí adresa OpenAI SDK)
+PERPLEXITY_BASE_URL = os.getenv("PERPLEXITY_BASE_URL", "https://api.perplexity.ai")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+
+# Cache výsledků segmentace (paměť + disk, prázdný adresář = bez diskové cache)
+SEGMENT_CACHE_ENTRIES = 64
+SEGMENT_CACHE_DIR = ".cache/segmentation"
+SEGMENT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Sdílené HTTP spojení (keep-alive pool na hosta)
+HTTP_POOL_CONNECTIONS = 10
+HTTP_POOL_MAXSIZE = 20
+HTTP_CONNECT_TIMEOUT = 5
+OPENAI_CLIENT_CACHE_SIZE = 32
+
+# Cache vygenerovaných příběhů (prázdný adresář = jen v paměti)
+STORY_CACHE_ENTRIES = 512
+STORY_CACHE_VARIANTS = 3
+STORY_CACHE_TTL = 7 * 24 * 3600
+STORY_CACHE_DIR = ""
+STORY_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Prefetch příběhů po segmentaci
+PREFETCH_TOP_N = 3
+PREFETCH_CONCURRENCY = 2
+# Jak dlouho po kliknutí čekat na ještě běžící prefetch, než se příběh začne streamovat znovu (s)
+PREFETCH_WAIT = 2.0
+
+# Jak dlouho nejvýš čekat na shodný souběžný požadavek (segmentace, příběh), než se to vzdá
+SINGLEFLIGHT_TIMEOUT = 120
+
+# Paralelní dekódování masek segmentů
+MASK_DECODE_WORKERS = 8
+
+# Dokreslit do výsledku ohraničení segmentů (bbox z jejich statistik)
+SEGMENT_DRAW_BOXES = False
+
+# Segmentace ve vysokém rozlišení po dlaždicích
+TILED_MAX_SIZE = 4096
+TILE_SIZE = 512
+TILE_OVERLAP = 64
+TILE_WORKERS = 4
+
+# Segmentační backend: "huggingface", "local-http" (stub_server.py), "transformers" (CPU v procesu), "synthetic"
+SEGMENTATION_BACKEND = os.getenv("SEGMENTATION_BACKEND", "huggingface")
+# Vlastní URL pro HTTP backendy (prázdné = výchozí adresa backendu)
+SEGMENTATION_BACKEND_URL = os.getenv("SEGMENTATION_BACKEND_URL", "")
+# Odesílání obrázku: surové bajty (True) nebo Base64 v JSON. Kvalita JPEG se snižuje podle
+# SEGMENT_JPEG_QUALITIES, dokud se obrázek nevejde do SEGMENT_UPLOAD_MAX_BYTES
+SEGMENT_BINARY_UPLOAD = os.getenv("SEGMENT_BINARY_UPLOAD", "1") == "1"
+SEGMENT_UPLOAD_MAX_BYTES = 150 * 1024
+SEGMENT_JPEG_QUALITIES = (90, 80, 70, 60, 50)
+
+# Opakování požadavků (backoff s jitterem, deadline v sekundách) pro jednotlivé poskytovatele
+RETRY_POLICIES = {
+    "huggingface": {"max_attempts": 5, "base_delay": 1.0, "max_delay": 20.0, "deadline": 90.0},
+    "perplexity": {"max_attempts": 3, "base_delay": 0.5, "max_delay": 8.0, "deadline": 60.0},
+    "openai": {"max_attempts": 3, "base_delay": 0.5, "max_delay": 8.0, "deadline": 60.0},
+}
+# Hedged požadavky: po kolika sekundách bez odpovědi poslat souběžně další pokus (0 = vypnuto)
+HEDGE_AFTER_SECONDS = {
+    "huggingface": 0,
+    "perplexity": 0,
+    "openai": 0,
+}
+
+# Řízení přístupu k poskytovatelům (celý proces): požadavky za sekundu, burst, LLM tokeny za minutu
+# (počítá se max_tokens požadavku). Poskytovatel bez záznamu není omezený.
+# Proměnná ADMISSION_LIMITS (JSON) je nahradí celé, např. "{}" = bez omezení při zátěžových testech
+ADMISSION_LIMITS = json.loads(os.getenv("ADMISSION_LIMITS") or "null")
+if ADMISSION_LIMITS is None:
+    ADMISSION_LIMITS = {
+        "huggingface": {"requests_per_second": 5, "burst": 10},
+        "perplexity": {"requests_per_second": 1, "burst": 5, "tokens_per_minute": 120000},
+        "openai": {"requests_per_second": 3, "burst": 10, "tokens_per_minute": 200000},
+    }
+# Nejvýš čekajících požadavků jedné session (odpovídá souběžným dlaždicím), celkem a max. čekání v sekundách
+ADMISSION_MAX_QUEUE_PER_SESSION = 4
+ADMISSION_MAX_WAITING = 200
+ADMISSION_TIMEOUT = 60
+
+# Směrování mezi poskytovateli LLM a circuit breaker
+ROUTER_WINDOW = 50
+ROUTER_MIN_SAMPLES = 10
+ROUTER_ERROR_RATE = 0.5
+ROUTER_CONSECUTIVE_FAILURES = 3
+ROUTER_COOLDOWN = 30
+
+# Výsledky sessions (zakódovaný obrázek) mimo st.session_state: limit na session, limit paměti celkem,
+# po jaké době nečinnosti se session přesune na disk (prázdný adresář = nečinné sessions se zahodí)
+SESSION_MAX_BYTES = 2 * 1024 * 1024
+SESSION_STORE_MAX_BYTES = 256 * 1024 * 1024
+SESSION_IDLE_SECONDS = 15 * 60
+SESSION_SPILL_DIR = ".cache/sessions"
+SESSION_SPILL_MAX_BYTES = 1024 * 1024 * 1024
+# Obrázek se ukládá jen ve velikosti pro zobrazení (šířka 600 px, 2x pro HiDPI displeje)
+SESSION_DISPLAY_MAX_SIZE = 1200
+SESSION_IMAGE_QUALITY = 85
+
+# Měření časů fází (METRICS_LOG = strukturované logy, METRICS_FILE = soubor ve formátu Prometheus)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_LOG = os.getenv("METRICS_LOG", "0") == "1"
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+
+# HTTP služba server.py: mikro-batching (okno v sekundách, max. velikost dávky),
+# počty vláken pro jednotlivé fáze a délka fronty, nad kterou se vrací 503
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8700"))
+SERVER_BATCH_WINDOW = 0.01
+SERVER_MAX_BATCH = 8
+SERVER_SEGMENT_WORKERS = 4
+SERVER_COMPOSITE_WORKERS = 2
+SERVER_STORY_WORKERS = 8
+SERVER_MAX_QUEUE = 64
+SERVER_REQUEST_TIMEOUT = 120
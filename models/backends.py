@@ -0,0 +1,255 @@
+import base64
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from utils import admission, metrics, transport
+from utils.resilience import resilient_call, retry_after_from_response
+from config import SEGMENT_BINARY_UPLOAD, SEGMENT_UPLOAD_MAX_BYTES, SEGMENT_JPEG_QUALITIES
+
+HF_INFERENCE_URL = "https://api-inference.huggingface.co/models/{model_id}"
+LOCAL_HTTP_URL = "http://127.0.0.1:8600/models/{model_id}"
+
+# Třídy pro syntetické odpovědi (mix "things" i "stuff" variant z Mask2Former)
+SYNTHETIC_LABELS = [
+    "person", "sky-other-merged", "tree-merged", "car", "wall-other-merged", "dog",
+    "grass-merged", "chair", "building-other-merged", "cup", "pavement-merged", "couch",
+]
+
+
+class SegmentationAPIError(Exception):
+    """Segmentační API vrátilo jiný stav než 200"""
+    def __init__(self, status_code, message="", retry_after=None):
+        super().__init__(f"Chyba API {status_code}: {message}")
+        self.status_code = status_code
+        # Kolik sekund čekat před dalším pokusem (Retry-After / estimated_time), pokud to server řekl
+        self.retry_after = retry_after
+
+
+def encode_mask(mask):
+    """Bool maska -> Base64 PNG (stejný formát jako v odpovědi Hugging Face API)"""
+    buffer = BytesIO()
+    Image.fromarray(mask.astype(np.uint8) * 255, "L").save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def encode_image(pil_img, max_bytes=SEGMENT_UPLOAD_MAX_BYTES, qualities=SEGMENT_JPEG_QUALITIES):
+    """
+    Zakóduje obrázek do JPEG s nejvyšší kvalitou z `qualities`, která se vejde do `max_bytes`.
+    Když se nevejde ani nejnižší kvalita, vrátí se ta (rozměry se nemění, masky musí sedět na obrázek).
+    Vrací (bytes, kvalita)
+    """
+    if pil_img.mode not in ("RGB", "L"):
+        pil_img = pil_img.convert("RGB")
+    for quality in qualities:
+        buffer = BytesIO()
+        pil_img.save(buffer, format="JPEG", quality=quality)
+        if buffer.tell() <= max_bytes:
+            break
+    return buffer.getvalue(), quality
+
+
+def synthetic_panoptic_response(size, n_segments=8, seed=0):
+    """
+    Vygeneruje syntetickou panoptickou odpověď pro obrázek velikosti `size` (šířka, výška).
+    Segmenty jsou Voronoiovy buňky kolem náhodných bodů - nepřekrývají se a pokryjí celý obrázek.
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    n_segments = max(1, n_segments)
+    points = rng.random((n_segments, 2)) * (width, height)
+
+    ys, xs = np.mgrid[0:height, 0:width]
+    nearest = np.zeros((height, width), dtype=np.int32)
+    best = np.full((height, width), np.inf)
+    for i, (px, py) in enumerate(points):
+        distance = (xs - px) ** 2 + (ys - py) ** 2
+        closer = distance < best
+        nearest[closer] = i
+        best[closer] = distance[closer]
+
+    return [
+        {
+            "score": round(float(rng.uniform(0.5, 1.0)), 4),
+            "label": SYNTHETIC_LABELS[i % len(SYNTHETIC_LABELS)],
+            "mask": encode_mask(nearest == i),
+        }
+        for i in range(n_segments)
+    ]
+
+
+class SegmentationBackend:
+    """
+    Rozhraní segmentačního backendu.
+    segment() vrací surovou panoptickou odpověď ve formátu Hugging Face API:
+    [{"label": ..., "score": ..., "mask": <Base64 PNG>}, ...]
+    """
+    name = "base"
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+
+    @property
+    def cache_id(self):
+        """Identifikace pro klíč cache - výsledky různých backendů se nemíchají"""
+        return f"{self.name}:{self.model_id}"
+
+    def segment(self, pil_img, hf_token):
+        raise NotImplementedError
+
+    def segment_batch(self, pil_imgs, hf_token, contexts=None):
+        """
+        Segmentace více obrázků (mikro-batching v server.py). Vrací seznam odpovědí
+        nebo výjimek, po jedné na obrázek. Výchozí implementace posílá požadavky souběžně.
+        `contexts` = kontext pro každý obrázek (session v admission, trace), jinak kopie aktuálního.
+        """
+        def capture(pil_img):
+            try:
+                return self.segment(pil_img, hf_token)
+            except Exception as e:
+                return e
+
+        if contexts is None:
+            contexts = [contextvars.copy_context() for _ in pil_imgs]
+        if len(pil_imgs) == 1:
+            return [contexts[0].run(capture, pil_imgs[0])]
+        with ThreadPoolExecutor(max_workers=len(pil_imgs), thread_name_prefix=f"{self.name}-batch") as pool:
+            futures = [pool.submit(context.run, capture, pil_img) for pil_img, context in zip(pil_imgs, contexts)]
+            return [future.result() for future in futures]
+
+
+class HuggingFaceBackend(SegmentationBackend):
+    """Hugging Face Inference API (nebo jiný server se stejným rozhraním na `url`)"""
+    name = "huggingface"
+
+    def __init__(self, model_id, url=None, read_timeout=30, binary=SEGMENT_BINARY_UPLOAD):
+        super().__init__(model_id)
+        self.url = url or HF_INFERENCE_URL.format(model_id=model_id)
+        self.read_timeout = read_timeout
+        # Surové bajty místo Base64 v JSON (o třetinu menší payload, bez kódování na obou stranách)
+        self.binary = binary
+
+    @property
+    def cache_id(self):
+        return self.model_id
+
+    def segment(self, pil_img, hf_token):
+        # Příprava obrázku pro API
+        with metrics.span("encode_image"):
+            image_bytes, quality = encode_image(pil_img)
+            if self.binary:
+                headers = {"Authorization": f"Bearer {hf_token}", "Content-Type": "image/jpeg"}
+                body = image_bytes
+            else:
+                img_str = base64.b64encode(image_bytes).decode("utf-8")
+                headers = {"Authorization": f"Bearer {hf_token}", "Content-Type": "application/json"}
+                body = json.dumps({"inputs": img_str}).encode("utf-8")
+        metrics.inc("segment_upload_bytes", len(body))
+        metrics.inc("segment_uploads")
+
+        def request():
+            admission.admit("huggingface")
+            response = transport.post(self.url, read_timeout=self.read_timeout, headers=headers, data=body)
+            if response.status_code != 200:
+                raise SegmentationAPIError(response.status_code, response.text, retry_after_from_response(response))
+            return response.json()
+
+        # HF vrací 503 při studeném startu modelu - opakujeme podle estimated_time
+        with metrics.span("segment_request", backend=self.name, bytes=len(body), quality=quality):
+            return resilient_call("huggingface", request)
+
+
+class LocalHTTPBackend(HuggingFaceBackend):
+    """Lokální zástupný server (stub_server.py) se stejným formátem odpovědí jako Hugging Face"""
+    name = "local-http"
+
+    def __init__(self, model_id, url=None, read_timeout=30, binary=SEGMENT_BINARY_UPLOAD):
+        super().__init__(model_id, url or LOCAL_HTTP_URL.format(model_id=model_id), read_timeout, binary)
+
+    @property
+    def cache_id(self):
+        return f"{self.name}:{self.model_id}"
+
+
+class TransformersBackend(SegmentationBackend):
+    """
+    Segmentace přímo v procesu na CPU přes knihovnu transformers (volitelná závislost).
+    Model se načte při prvním použití.
+    """
+    name = "transformers"
+
+    def __init__(self, model_id):
+        super().__init__(model_id)
+        self._pipeline = None
+        self._lock = threading.Lock()
+
+    def _get_pipeline(self):
+        with self._lock:
+            if self._pipeline is None:
+                try:
+                    from transformers import pipeline
+                except ImportError as e:
+                    raise ImportError("Backend 'transformers' vyžaduje balíčky transformers a torch") from e
+                self._pipeline = pipeline("image-segmentation", model=self.model_id, device=-1)
+            return self._pipeline
+
+    @staticmethod
+    def _to_response(results):
+        return [
+            {
+                "score": result.get("score"),
+                "label": result["label"],
+                "mask": encode_mask(np.asarray(result["mask"]) > 128),
+            }
+            for result in results
+        ]
+
+    def segment(self, pil_img, hf_token):
+        with metrics.span("segment_request", backend=self.name):
+            results = self._get_pipeline()(pil_img.convert("RGB"), subtask="panoptic")
+        return self._to_response(results)
+
+    def segment_batch(self, pil_imgs, hf_token, contexts=None):
+        """Celá dávka jedním voláním modelu (pipeline přijímá seznam obrázků)"""
+        if len(pil_imgs) == 1:
+            return super().segment_batch(pil_imgs, hf_token, contexts)
+        try:
+            with metrics.span("segment_request", backend=self.name, batch=len(pil_imgs)):
+                batch_results = self._get_pipeline()([img.convert("RGB") for img in pil_imgs], subtask="panoptic")
+        except Exception as e:
+            return [e] * len(pil_imgs)
+        return [self._to_response(results) for results in batch_results]
+
+
+class SyntheticBackend(SegmentationBackend):
+    """Syntetické odpovědi v procesu - bez sítě a bez modelu (testy, benchmarky)"""
+    name = "synthetic"
+
+    def __init__(self, model_id, n_segments=8):
+        super().__init__(model_id)
+        self.n_segments = n_segments
+
+    def segment(self, pil_img, hf_token):
+        # Seed z obsahu obrázku, aby stejný obrázek dal stejný výsledek
+        seed = int.from_bytes(pil_img.resize((8, 8)).tobytes()[:8].ljust(8, b"\0"), "little")
+        return synthetic_panoptic_response(pil_img.size, self.n_segments, seed)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (HuggingFaceBackend, LocalHTTPBackend, TransformersBackend, SyntheticBackend)
+}
+
+
+def create_backend(name, model_id, url=None):
+    """Vytvoří backend podle názvu z configu"""
+    if name not in BACKENDS:
+        raise ValueError(f"Neznámý segmentační backend: {name} (dostupné: {', '.join(BACKENDS)})")
+    if url and name in ("huggingface", "local-http"):
+        return BACKENDS[name](model_id, url=url)
+    return BACKENDS[name](model_id)
@@ -0,0 +1,147 @@
+import numpy as np
+from PIL import Image
+
+# Přesnost fixed-point aritmetiky v Pillow (AlphaComposite.c)
+_PRECISION_BITS = 7
+
+
+def blend_pixels(dst, src):
+    """
+    Alfa-blending pole pixelů `src` (M x 4) přes `dst` (M x 4), obojí RGBA.
+    Používá stejnou celočíselnou aritmetiku jako Image.alpha_composite,
+    takže výsledek je bit po bitu shodný se skládáním vrstev v Pillow.
+    Pixely s nulovou alfou v `src` se nemění.
+    """
+    dst = dst.astype(np.uint32)
+    src = np.broadcast_to(np.asarray(src, dtype=np.uint32), dst.shape)
+    src_a = src[:, 3]
+    dst_a = dst[:, 3]
+
+    blend = dst_a * (255 - src_a)
+    outa255 = src_a * 255 + blend
+    # Pro průhledné pixely (outa255 == 0) dělení přeskočíme, výsledek se stejně nepoužije
+    coef1 = (src_a * 255 * 255 * (1 << _PRECISION_BITS)) // np.maximum(outa255, 1)
+    coef2 = 255 * (1 << _PRECISION_BITS) - coef1
+
+    out = np.empty_like(dst)
+    for channel in range(3):
+        tmp = src[:, channel] * coef1 + dst[:, channel] * coef2 + (0x80 << _PRECISION_BITS)
+        out[:, channel] = (((tmp >> 8) + tmp) >> 8) >> _PRECISION_BITS
+    tmp = outa255 + 0x80
+    out[:, 3] = ((tmp >> 8) + tmp) >> 8
+
+    out = np.where((src_a == 0)[:, None], dst, out)
+    return out.astype(np.uint8)
+
+
+class LabelMap:
+    """
+    Kompaktní reprezentace panoptického výsledku.
+    Místo N masek velikosti obrázku drží jednu mapu indexů (uint8/uint16 na pixel,
+    0 = pozadí, i + 1 = segment i) a tabulku segmentů s popiskem, skóre a barvou.
+    Kde se masky překrývají, platí pozdější segment (stejně jako při skládání vrstev).
+    """
+    def __init__(self, index, segments, errors=None):
+        self.index = index
+        self.segments = segments
+        # Chyby při dekódování jednotlivých segmentů (necacheují se)
+        self.errors = errors or []
+
+    @classmethod
+    def from_masks(cls, size, labels, masks, scores=None, colors=None):
+        """
+        Sestaví mapu z bool masek (None = segment bez masky).
+        `size` je (šířka, výška) jako u PIL.
+        """
+        width, height = size
+        dtype = np.uint8 if len(masks) < 255 else np.uint16
+        index = np.zeros((height, width), dtype=dtype)
+        segments = []
+        for i, mask in enumerate(masks):
+            if mask is not None:
+                index[mask] = i + 1
+            segments.append({
+                "label": labels[i],
+                "score": scores[i] if scores is not None else None,
+                "color": tuple(colors[i]) if colors is not None else (0, 0, 0, 0),
+            })
+        return cls(index, segments)
+
+    @property
+    def size(self):
+        return (self.index.shape[1], self.index.shape[0])
+
+    @property
+    def nbytes(self):
+        return self.index.nbytes
+
+    def __len__(self):
+        return len(self.segments)
+
+    def labels(self):
+        """Popisky všech segmentů (v pořadí segmentů, mohou se opakovat)"""
+        return [segment["label"] for segment in self.segments]
+
+    def mask(self, i):
+        """Bool maska segmentu i"""
+        return self.index == i + 1
+
+    def segment_at(self, x, y):
+        """Segment pod pixelem (x, y), nebo None (hit testing)"""
+        i = int(self.index[y, x])
+        return self.segments[i - 1] if i else None
+
+    def stats(self):
+        """
+        Plocha (počet pixelů), ohraničení (x1, y1, x2, y2), těžiště (x, y) a skóre všech segmentů.
+        Počítá se najednou dvěma bincount průchody přes mapu (počty pixelů segmentů po řádcích
+        a po sloupcích), bez smyčky přes masky. Segment bez pixelů má plochu 0, bbox a těžiště None.
+        """
+        height, width = self.index.shape
+        n = len(self.segments) + 1
+        index = self.index.astype(np.intp)
+        # rows[y, i] = počet pixelů segmentu i - 1 na řádku y (sloupec 0 je pozadí), cols obdobně
+        rows = np.bincount((np.arange(height, dtype=np.intp)[:, None] * n + index).ravel(), minlength=height * n).reshape(height, n)
+        cols = np.bincount((np.arange(width, dtype=np.intp)[None, :] * n + index).ravel(), minlength=width * n).reshape(width, n)
+
+        areas = rows.sum(axis=0)
+        safe_areas = np.maximum(areas, 1)
+        centroid_y = (rows * np.arange(height)[:, None]).sum(axis=0) / safe_areas
+        centroid_x = (cols * np.arange(width)[:, None]).sum(axis=0) / safe_areas
+        row_present = rows > 0
+        col_present = cols > 0
+        y1 = row_present.argmax(axis=0)
+        y2 = height - 1 - row_present[::-1].argmax(axis=0)
+        x1 = col_present.argmax(axis=0)
+        x2 = width - 1 - col_present[::-1].argmax(axis=0)
+
+        stats = []
+        for i, segment in enumerate(self.segments, start=1):
+            present = bool(areas[i])
+            stats.append({
+                "label": segment["label"],
+                "score": segment["score"],
+                "area": int(areas[i]),
+                "bbox": (int(x1[i]), int(y1[i]), int(x2[i]), int(y2[i])) if present else None,
+                "centroid": (float(centroid_x[i]), float(centroid_y[i])) if present else None,
+            })
+        return stats
+
+    def palette(self):
+        """Tabulka barev RGBA: řádek 0 je průhledné pozadí, řádek i + 1 barva segmentu i"""
+        palette = np.zeros((len(self.segments) + 1, 4), dtype=np.uint8)
+        for i, segment in enumerate(self.segments):
+            palette[i + 1] = segment["color"]
+        return palette
+
+    def render(self, image):
+        """Překryje obrázek barvami segmentů jedním vyhledáním v paletě a vrátí RGBA obrázek"""
+        pixels = np.array(image.convert("RGBA"))
+        if self.index.shape != pixels.shape[:2]:
+            raise ValueError("Velikost mapy segmentů neodpovídá obrázku")
+
+        covered = self.index > 0
+        if covered.any():
+            overlay = self.palette()[self.index[covered]]
+            pixels[covered] = blend_pixels(pixels[covered], overlay)
+        return Image.fromarray(pixels, "RGBA")
@@ -1,20 +1,86 @@
 import sys
 import os
 from pathlib import Path
-import requests
 import re
-import openai
-from config import PER_API_TOKEN, OPENAI_API_KEY
+import json
+import time
+from utils import admission, metrics, transport
+from utils.resilience import resilient_call, retry_after_from_response, retry_after_seconds
+from config import PER_API_TOKEN, OPENAI_API_KEY, PERPLEXITY_BASE_URL, OPENAI_BASE_URL
 
 # """Absolutní cesta ke kořenovému adresáři projektu pro testování v terminálu"""
 # project_root = Path(__file__).resolve().parent.parent  # ← o úroveň výš než models/
 # sys.path.append(str(project_root))
 
+SYSTEM_ROLE = (
+    "Jsi největší odborník na evoluční antropologii s neodolatelným smyslem pro humor. "
+    "Tvé znalosti sahají od prehistorických nástrojů po moderní technologie a vždy dokážeš vykouzlit úsměv na tváři."
+)
+
+# Samostatné [číslo] výskyty (ne [^číslo] citace)
+CITATION_PATTERN = re.compile(r'\[(?!\^)\d+\]')
+# Možný začátek odkazu na konci chunku, např. "[" nebo "[12"
+_PARTIAL_CITATION = re.compile(r'\[\d*$')
+
+def build_messages(prompt):
+    """Zprávy pro chat API - systémová role a prompt uživatele"""
+    return [
+        {"role": "system", "content": SYSTEM_ROLE},
+        {"role": "user", "content": prompt}
+    ]
+
+def strip_citations(text):
+    """Odstranění samostatných [číslo] výskytů"""
+    return CITATION_PATTERN.sub('', text)
+
+def strip_citations_stream(chunks):
+    """
+    Odstraňuje [číslo] výskyty z proudu textu.
+    Konec chunku, který může být začátkem odkazu, se podrží do dalšího chunku,
+    takže se odstraní i odkaz rozdělený přes hranici chunků.
+    """
+    pending = ""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        text = strip_citations(pending + chunk)
+        match = _PARTIAL_CITATION.search(text)
+        if match:
+            pending = text[match.start():]
+            text = text[:match.start()]
+        else:
+            pending = ""
+        if text:
+            yield text
+    if pending:
+        yield strip_citations(pending)
+
+def _timed_stream(chunks, provider):
+    """Měří čas do prvního chunku (to uživatel vnímá) a celkovou dobu streamu"""
+    if not metrics.is_enabled():
+        yield from chunks
+        return
+    start = time.perf_counter()
+    first = True
+    for chunk in chunks:
+        if first:
+            metrics.record("llm_first_chunk", time.perf_counter() - start, provider=provider)
+            first = False
+        yield chunk
+    metrics.record("llm_stream", time.perf_counter() - start, provider=provider)
+
+class LLMAPIError(Exception):
+    """API poskytovatele LLM vrátilo jiný stav než 200"""
+    def __init__(self, status_code, message="", retry_after=None):
+        super().__init__(f"Chyba API {status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
 class PerplexityLLM:
     def __init__(self, api_key=None, model="sonar"):
         self.api_key = api_key or PER_API_TOKEN
         self.model = model
-        self.base_url = "https://api.perplexity.ai/chat/completions"
+        self.base_url = f"{PERPLEXITY_BASE_URL.rstrip('/')}/chat/completions"
 
     def generate(self, prompt, max_tokens=2000, temperature=0.7):
         headers = {
@@ -23,58 +89,155 @@ class PerplexityLLM:
         }
         payload = {
             "model": self.model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "Jsi největší odborník na evoluční antropologii s neodolatelným smyslem pro humor. Tvé znalosti sahají od prehistorických nástrojů po moderní technologie a vždy dokážeš vykouzlit úsměv na tváři."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+            "messages": build_messages(prompt),
             "max_tokens": max_tokens,
             "temperature": temperature
         }
-        response = requests.post(self.base_url, headers=headers, json=payload, timeout=60)
-        if response.status_code == 200:
-            generated_text = response.json()["choices"][0]["message"]["content"]
-            # Odstranění samostatných [číslo] výskytů (ne na konci věty)
-            cleaned_text = re.sub(r'\[(?!\^)\d+\]', '', generated_text)
-            return cleaned_text
-        else:
-            raise Exception(f"Chyba API {response.status_code}: {response.text}")
+        with metrics.span("llm_generate", provider="perplexity"):
+            response = resilient_call("perplexity", lambda: self._post(headers, payload))
+        generated_text = response.json()["choices"][0]["message"]["content"]
+        # Odstranění samostatných [číslo] výskytů (ne na konci věty)
+        cleaned_text = strip_citations(generated_text)
+        return cleaned_text
+
+    def _post(self, headers, payload, stream=False):
+        """Jeden pokus o požadavek; chybový stav vyhodí jako LLMAPIError (pro opakování)"""
+        admission.admit("perplexity", tokens=payload.get("max_tokens", 0))
+        response = transport.post(self.base_url, read_timeout=60, headers=headers, json=payload, stream=stream)
+        if response.status_code != 200:
+            error = LLMAPIError(response.status_code, response.text, retry_after_from_response(response))
+            response.close()
+            raise error
+        return response
+
+    def generate_stream(self, prompt, max_tokens=2000, temperature=0.7):
+        """Generuje text po částech (server-sent events), jak přicházejí z API"""
+        return strip_citations_stream(_timed_stream(self._stream_chunks(prompt, max_tokens, temperature), "perplexity"))
+
+    def _stream_chunks(self, prompt, max_tokens, temperature):
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+        payload = {
+            "model": self.model,
+            "messages": build_messages(prompt),
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        }
+        # Opakuje se jen navázání spojení - po prvním chunku už by opakování duplikovalo text
+        response = resilient_call("perplexity", lambda: self._post(headers, payload, stream=True))
+        with response:
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                if choices:
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
 
 class OpenAILLM:
     def __init__(self, api_key=None, model="gpt-4o"):
         self.api_key = api_key or OPENAI_API_KEY
         self.model = model
-        self.client = openai.OpenAI(api_key=self.api_key)
+        self.client = transport.get_openai_client(self.api_key, base_url=OPENAI_BASE_URL or None)
+
+    def _create(self, **kwargs):
+        """Volání chat API s opakováním při rate limitu a přechodných chybách"""
+        import openai
+
+        def request():
+            admission.admit("openai", tokens=kwargs.get("max_tokens", 0))
+            try:
+                return self.client.chat.completions.create(**kwargs)
+            except openai.APIStatusError as e:
+                raise LLMAPIError(e.status_code, str(e), retry_after_seconds(e.response.headers)) from e
+
+        return resilient_call("openai", request, retry_on=(openai.APIConnectionError,))
 
     def generate(self, prompt, max_tokens=2000, temperature=0.7):
         try:
-            response = self.client.chat.completions.create(
+            with metrics.span("llm_generate", provider="openai"):
+                response = self._create(
+                    model=self.model,
+                    messages=build_messages(prompt),
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
+            generated_text = response.choices[0].message.content
+            cleaned_text = strip_citations(generated_text)
+            return cleaned_text
+        except Exception as e:
+            raise Exception(f"Chyba OpenAI API: {str(e)}")
+
+    def generate_stream(self, prompt, max_tokens=2000, temperature=0.7):
+        """Generuje text po částech, jak přicházejí z API"""
+        return strip_citations_stream(_timed_stream(self._stream_chunks(prompt, max_tokens, temperature), "openai"))
+
+    def _stream_chunks(self, prompt, max_tokens, temperature):
+        try:
+            stream = self._create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Jsi největší odborník na evoluční antropologii s neodolatelným smyslem pro humor. Tvé znalosti sahají od prehistorických nástrojů po moderní technologie a vždy dokážeš vykouzlit úsměv na tváři."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+                messages=build_messages(prompt),
                 max_tokens=max_tokens,
-                temperature=temperature
+                temperature=temperature,
+                stream=True
             )
-            generated_text = response.choices[0].message.content
-            cleaned_text = re.sub(r'\[(?!\^)\d+\]', '', generated_text)
-            return cleaned_text
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
         except Exception as e:
             raise Exception(f"Chyba OpenAI API: {str(e)}")
 
 
+class _AsyncChatLLM:
+    """Společný základ asynchronních klientů pro OpenAI-kompatibilní chat API"""
+    base_url = None
+
+    def __init__(self, api_key, model):
+        self.api_key = api_key
+        self.model = model
+        self.client = transport.get_async_openai_client(self.api_key, base_url=self.base_url)
+
+    async def generate(self, prompt, max_tokens=2000, temperature=0.7):
+        try:
+            # Prefetch nesmí blokovat event loop ani předbíhat interaktivní požadavky -
+            # když limit není hned volný, příběh se vygeneruje až na kliknutí
+            admission.admit(self.provider.lower(), tokens=max_tokens, block=False)
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=build_messages(prompt),
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            return strip_citations(response.choices[0].message.content)
+        except Exception as e:
+            raise Exception(f"Chyba {self.provider} API: {str(e)}")
+
+class AsyncPerplexityLLM(_AsyncChatLLM):
+    """Asynchronní varianta PerplexityLLM (Perplexity API je kompatibilní s OpenAI klientem)"""
+    provider = "Perplexity"
+    base_url = PERPLEXITY_BASE_URL
+
+    def __init__(self, api_key=None, model="sonar"):
+        super().__init__(api_key or PER_API_TOKEN, model)
+
+class AsyncOpenAILLM(_AsyncChatLLM):
+    """Asynchronní varianta OpenAILLM"""
+    provider = "OpenAI"
+    base_url = OPENAI_BASE_URL or None
+
+    def __init__(self, api_key=None, model="gpt-4o"):
+        super().__init__(api_key or OPENAI_API_KEY, model)
+
+
 # """Testování v terminálu"""
 # if __name__ == "__main__":
 #     from utils.prompt_utils import PromptBuilder
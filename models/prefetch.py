@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from concurrent.futures import CancelledError, TimeoutError
+
+from models import story_cache
+from config import PREFETCH_TOP_N, PREFETCH_CONCURRENCY
+
+# Jedna sdílená event loop ve vlákně na pozadí pro všechny sessions
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="story-prefetch", daemon=True).start()
+        return _loop
+
+
+class StoryPrefetcher:
+    """
+    Na pozadí generuje příběhy pro první třídy po segmentaci.
+    Každá session má vlastní instanci (souběžnost je omezená na session),
+    hotové příběhy se ukládají i do sdílené story cache.
+    """
+    def __init__(self, max_concurrency=PREFETCH_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._futures = {}
+        self._semaphore = None
+
+    def start(self, llm_model, provider, topics, builder, temperature=0.7, top_n=PREFETCH_TOP_N):
+        """Naplánuje generování pro prvních `top_n` témat (asynchronní LLM klient)"""
+        loop = _get_loop()
+        for topic in topics[:top_n]:
+            key = story_cache.story_key(provider, llm_model.model, topic, temperature, builder)
+            if key in self._futures:
+                continue
+            coro = self._prefetch(llm_model, key, builder.build(topic), temperature)
+            self._futures[key] = asyncio.run_coroutine_threadsafe(coro, loop)
+
+    async def _prefetch(self, llm_model, key, prompt, temperature):
+        # Semafor musí vzniknout uvnitř event loopu
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            text = await llm_model.generate(prompt, temperature=temperature)
+        story_cache.story_cache.add(key, text)
+        return text
+
+    def result(self, key, timeout=None):
+        """
+        Vrátí předgenerovaný příběh pro klíč (jen jednou - další volání už generuje nový).
+        Pokud generování ještě běží, počká na něj. Při chybě nebo zrušení vrátí None.
+        """
+        future = self._futures.pop(key, None)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except (CancelledError, TimeoutError):
+            future.cancel()
+            return None
+        except Exception:
+            return None
+
+    def cancel(self):
+        """Zruší všechna běžící i čekající generování (např. po Resetu)"""
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
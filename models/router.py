@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import deque
+
+from utils.batching import Overloaded
+
+from config import (
+    ROUTER_WINDOW, ROUTER_MIN_SAMPLES, ROUTER_ERROR_RATE,
+    ROUTER_CONSECUTIVE_FAILURES, ROUTER_COOLDOWN
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class ProviderHealth:
+    """
+    Klouzavé statistiky latence a chybovosti jednoho poskytovatele a circuit breaker.
+    Breaker se otevře po sérii chyb nebo při vysoké chybovosti v okně, po `cooldown`
+    sekundách pustí jeden zkušební požadavek (half-open) a podle výsledku se zavře nebo znovu otevře.
+    """
+    def __init__(self, name, window=ROUTER_WINDOW, cooldown=ROUTER_COOLDOWN):
+        self.name = name
+        self.cooldown = cooldown
+        self._samples = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._trial_running = False
+        return self._state
+
+    def allow_request(self):
+        """Smí jít požadavek na tohoto poskytovatele? (v half-open jen jeden zkušební)"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def release_trial(self):
+        """Zkušební požadavek skončil bez verdiktu (chyba klienta) - pustí se další"""
+        with self._lock:
+            self._trial_running = False
+
+    def record(self, latency, ok):
+        with self._lock:
+            self._samples.append((latency, ok))
+            if ok:
+                self._consecutive_failures = 0
+                if self._state == HALF_OPEN:
+                    self._state = CLOSED
+                    self._trial_running = False
+                return
+
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._should_open():
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+    def _should_open(self):
+        if self._consecutive_failures >= ROUTER_CONSECUTIVE_FAILURES:
+            return True
+        return len(self._samples) >= ROUTER_MIN_SAMPLES and self._error_rate() >= ROUTER_ERROR_RATE
+
+    def _error_rate(self):
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def stats(self):
+        """Medián a p95 latence úspěšných požadavků, chybovost a stav breakeru"""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+            return {
+                "state": self._current_state(),
+                "samples": len(self._samples),
+                "error_rate": self._error_rate(),
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+            }
+
+    def score(self):
+        """Nižší je lepší: medián latence penalizovaný chybovostí (bez dat = neutrální 0)"""
+        stats = self.stats()
+        if stats["p50"] is None:
+            return 0.0
+        return stats["p50"] * (1 + 4 * stats["error_rate"])
+
+
+# Statistiky jsou sdílené pro celý proces - všechny sessions vidí stejné zdraví poskytovatelů
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_health(name):
+    with _health_lock:
+        if name not in _health:
+            _health[name] = ProviderHealth(name)
+        return _health[name]
+
+
+def is_provider_fault(error):
+    """
+    Chyby klienta (neplatný klíč, špatný požadavek - 4xx kromě 408/429) nejsou známkou
+    špatného zdraví poskytovatele a do statistik se nepočítají. Prochází i zabalené výjimky.
+    Odmítnutí vlastním řízením přístupu (Overloaded) také není chyba poskytovatele.
+    """
+    while error is not None:
+        if isinstance(error, Overloaded):
+            return False
+        status_code = getattr(error, "status_code", None)
+        if status_code is not None:
+            return not (400 <= status_code < 500 and status_code not in (408, 429))
+        error = error.__cause__ or error.__context__
+    return True
+
+
+class LLMRouter:
+    """
+    Směrování požadavků mezi poskytovateli LLM (PerplexityLLM, OpenAILLM, ...).
+    Bez preference volí nejrychlejšího zdravého poskytovatele, s preferencí jde nejdřív
+    na preferovaného a při chybě přepne na další. Poskytovatelé s otevřeným breakerem
+    se přeskakují (dokud nejsou otevření všichni).
+    """
+    def __init__(self, providers, preferred=None):
+        self.providers = providers
+        self.preferred = preferred
+        self.last_provider = None
+
+    def order(self):
+        """Pořadí, ve kterém se poskytovatelé zkusí"""
+        names = sorted(self.providers, key=lambda name: get_health(name).score())
+        if self.preferred in names:
+            names.remove(self.preferred)
+            names.insert(0, self.preferred)
+        healthy = [name for name in names if get_health(name).state != OPEN]
+        return healthy or names
+
+    def _candidates(self):
+        for name in self.order():
+            health = get_health(name)
+            if health.allow_request() or health.state == OPEN:
+                yield name, health
+
+    def generate(self, prompt, **kwargs):
+        errors = []
+        for name, health in self._candidates():
+            start = time.monotonic()
+            try:
+                text = self.providers[name].generate(prompt, **kwargs)
+            except Exception as e:
+                if is_provider_fault(e):
+                    health.record(time.monotonic() - start, False)
+                else:
+                    health.release_trial()
+                errors.append(f"{name}: {str(e)}")
+                continue
+            health.record(time.monotonic() - start, True)
+            self.last_provider = name
+            return text
+        raise Exception("Žádný poskytovatel neodpověděl. " + " | ".join(errors))
+
+    def generate_stream(self, prompt, **kwargs):
+        """
+        Streamovaná varianta. Přepnout na jiného poskytovatele jde jen do prvního chunku;
+        jako latence se zaznamenává čas do prvního chunku.
+        """
+        errors = []
+        for name, health in self._candidates():
+            start = time.monotonic()
+            chunks = self.providers[name].generate_stream(prompt, **kwargs)
+            try:
+                first_chunk = next(chunks, "")
+            except Exception as e:
+                if is_provider_fault(e):
+                    health.record(time.monotonic() - start, False)
+                else:
+                    health.release_trial()
+                errors.append(f"{name}: {str(e)}")
+                continue
+            health.record(time.monotonic() - start, True)
+            self.last_provider = name
+            yield first_chunk
+            yield from chunks
+            return
+        raise Exception("Žádný poskytovatel neodpověděl. " + " | ".join(errors))
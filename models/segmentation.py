@@ -1,57 +1,122 @@
-import requests
 import streamlit as st
 import base64
+import numpy as np
 from io import BytesIO
 from PIL import Image, ImageDraw
 import colorsys
+import hashlib
+import json
+import os
+from models.label_map import LabelMap, blend_pixels
+from utils import admission, metrics
+from utils.cache import LRUCache, DiskCache, TieredCache
+from utils.singleflight import SingleFlight
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from models.tiling import tile_boxes, stitch_tiles
+from models.backends import SegmentationAPIError, create_backend
+from config import (
+    SEGMENT_CACHE_ENTRIES, SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES, MASK_DECODE_WORKERS,
+    TILE_SIZE, TILE_OVERLAP, TILE_WORKERS, SEGMENTATION_BACKEND, SEGMENTATION_BACKEND_URL,
+    SEGMENT_DRAW_BOXES, SINGLEFLIGHT_TIMEOUT
+)
 
 SEGMENTATION_MODEL = {
     "id": "facebook/mask2former-swin-large-coco-panoptic",
     "description": "Mask2Former - pokročilý model pro segmentaci objektů"
 }
 
-def draw_masks(image: Image.Image, boxes: list, color='red', width=3):
-    """Vykreslení segmentační masky na obrázek"""
+# Segmentační backend - HF API, lokální stub server, transformers na CPU, nebo syntetický
+_backend = create_backend(SEGMENTATION_BACKEND, SEGMENTATION_MODEL["id"], SEGMENTATION_BACKEND_URL or None)
+
+# Sdílený pool vláken pro dekódování masek (vzniká až při prvním použití)
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+def draw_masks(image: Image.Image, boxes: list, color='red', width=3, colors=None):
+    """Vykreslení segmentační masky na obrázek (`colors` = vlastní barva pro každý box)"""
     img = image.copy()
     draw = ImageDraw.Draw(img)
-    for box in boxes:
+    for i, box in enumerate(boxes):
         # box je [x1, y1, x2, y2]
-        draw.rectangle(box, outline=color, width=width)
+        draw.rectangle(box, outline=colors[i] if colors is not None else color, width=width)
     return img
 
+def _decode_mask(base64_string):
+    """Dekódování Base64 masky bez Streamlitu (chybu vyhodí)"""
+    # Dekódování Base64 řetězce na bytes
+    mask_bytes = base64.b64decode(base64_string)
+    # Převod na obrázek (load() vynutí dekódování PNG hned, ne až při prvním použití)
+    mask_img = Image.open(BytesIO(mask_bytes))
+    mask_img.load()
+    return mask_img
+
 def decode_base64_mask(base64_string):
     """Dekódování Base64 kódovaný obrázek masky"""
     try:
-        # Dekódování Base64 řetězce na bytes
-        mask_bytes = base64.b64decode(base64_string)
-        # Převod na obrázek
-        mask_img = Image.open(BytesIO(mask_bytes))
-        return mask_img
+        return _decode_mask(base64_string)
     except Exception as e:
         st.error(f"Chyba při dekódování masky: {str(e)}")
         return None
 
-def apply_colored_mask(image, mask_img, color=(255, 0, 0, 128)):
-    """Aplikujeme barevnou masku na obrázek"""
+def _mask_to_bool(mask_img, size):
+    """Převede masku na bool pole (pixel masky je dostatečně světlý)"""
+    # Už dekódovaná maska (např. z cache)
+    if isinstance(mask_img, np.ndarray):
+        return mask_img
+    # Převedeme masku na správnou velikost, pokud není stejná
+    if mask_img.size != size:
+        mask_img = mask_img.resize(size)
+    return np.asarray(mask_img.convert("L")) > 128
+
+def _alpha_blend(pixels, mask, color):
+    """Překryje pixely RGBA pole pod maskou barvou `color`"""
+    if color[3] == 0 or not mask.any():
+        return
+    pixels[mask] = blend_pixels(pixels[mask], color)
+
+def apply_colored_masks(image, mask_imgs, colors):
+    """
+    Aplikuje všechny barevné masky na obrázek v jednom průchodu nad NumPy polem.
+    Výsledek odpovídá postupnému volání apply_colored_mask pro každou masku.
+    """
     # Ujistíme se, že obrázek je v režimu RGBA
     img_rgba = image.convert("RGBA")
-    
-    # Převedeme masku na správnou velikost, pokud není stejná
-    if mask_img.size != image.size:
-        mask_img = mask_img.resize(image.size)
-    
-    # Vytvoříme barevnou masku
-    colored_mask = Image.new("RGBA", image.size, (0, 0, 0, 0))
-    mask_pixels = mask_img.convert("L")  # Převedeme na černobílou
-    
-    # Překreslíme masku danou barvou
-    for y in range(image.height):
-        for x in range(image.width):
-            if mask_pixels.getpixel((x, y)) > 128:  # Pokud je pixel masky dostatečně světlý
-                colored_mask.putpixel((x, y), color)
-    
-    # Překryjeme původní obrázek s barevnou maskou
-    return Image.alpha_composite(img_rgba, colored_mask)
+    pairs = list(zip(mask_imgs, colors))
+    if not pairs:
+        return img_rgba
+
+    masks = [_mask_to_bool(mask_img, image.size) for mask_img, _ in pairs]
+    palette = np.array([color for _, color in pairs], dtype=np.uint8).reshape(-1, 4)
+
+    # Počet masek a index (poslední) masky pod každým pixelem - levné operace po celých maskách,
+    # bez argmax přes osu masek
+    coverage = np.zeros(masks[0].shape, dtype=np.uint16)
+    owner = np.zeros(masks[0].shape, dtype=np.intp)
+    for i, mask in enumerate(masks):
+        coverage += mask
+        np.copyto(owner, i, where=mask)
+
+    # Jedna vrstva s barvou masky pod každým pixelem, složená jedním alpha_composite
+    single = coverage == 1
+    layer = np.zeros(masks[0].shape + (4,), dtype=np.uint8)
+    layer[single] = palette[owner[single]]
+    pixels = np.array(Image.alpha_composite(img_rgba, Image.fromarray(layer, "RGBA")))
+
+    # Překryvy (u panoptické segmentace výjimečné) se skládají postupně, jen na dotčených pixelech
+    overlap = coverage > 1
+    if overlap.any():
+        covered = pixels[overlap]
+        for mask, color in zip(masks, palette):
+            _alpha_blend(covered, mask[overlap], color)
+        pixels[overlap] = covered
+
+    return Image.fromarray(pixels, "RGBA")
+
+def apply_colored_mask(image, mask_img, color=(255, 0, 0, 128)):
+    """Aplikujeme barevnou masku na obrázek"""
+    return apply_colored_masks(image, [mask_img], [color])
 
 def generate_distinct_colors(n_colors, alpha=100):
     """
@@ -80,61 +145,298 @@ def generate_distinct_colors(n_colors, alpha=100):
     
     return colors
 
-def segment_image(image_array, hf_token):
+def _prepare_segment(segment, size):
+    """Dekóduje a připraví jeden segment: (popisek, bool maska, skóre, chyba)"""
+    label = None
+    if "label" in segment:
+        label = segment["label"].split(":")[-1].strip()
+
+    # Zpracování Base64 kódované masky
+    mask = None
+    error = None
+    if "mask" in segment:
+        try:
+            mask = _mask_to_bool(_decode_mask(segment["mask"]), size)
+        except Exception as e:
+            error = f"{label or '?'}: {str(e)}"
+
+    return label, mask, segment.get("score"), error
+
+def _get_decode_pool():
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            _decode_pool = ThreadPoolExecutor(max_workers=MASK_DECODE_WORKERS, thread_name_prefix="mask-decode")
+        return _decode_pool
+
+def _reset_decode_pool():
+    """Vlákna poolu fork nepřežijí - potomek si založí vlastní pool"""
+    global _decode_pool, _decode_pool_lock
+    _decode_pool = None
+    _decode_pool_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_decode_pool)
+
+def parse_segments(results, size):
     """
-    Segmentuje obrázek pomocí Mask2Former modelu přes Hugging Face API
-    Vrací obrázek se segmentačními maskami a unikátní třídy objektů
+    Převede odpověď API na LabelMap - jednu mapu indexů segmentů velikosti `size`
+    a tabulku segmentů (popisek, skóre, barva).
+    Masky se dekódují paralelně (dekodér PNG i zlib uvolňují GIL), pořadí segmentů zůstává.
+    Chyby jednotlivých segmentů se sbírají do `LabelMap.errors`.
     """
-    # Konverze numpy array na PIL Image
-    pil_img = Image.fromarray(image_array)
-    
-    # Příprava obrázku pro API
+    if not isinstance(results, list):
+        results = []
+
+    # Vygenerovat unikátní barvy podle počtu segmentů
+    colors = generate_distinct_colors(len(results))
+
+    if len(results) > 1:
+        prepared = list(_get_decode_pool().map(lambda segment: _prepare_segment(segment, size), results))
+    else:
+        prepared = [_prepare_segment(segment, size) for segment in results]
+
+    labels = [label for label, _, _, _ in prepared]
+    masks = [mask for _, mask, _, _ in prepared]
+    scores = [score for _, _, score, _ in prepared]
+    errors = [error for _, _, _, error in prepared if error is not None]
+
+    label_map = LabelMap.from_masks(size, labels, masks, scores, colors)
+    label_map.errors = errors
+    return label_map
+
+def rank_labels(label_map):
+    """
+    Unikátní třídy seřazené od nejvýznamnější: podíl plochy obrázku, kterou třída zabírá,
+    vážený skóre segmentů (segment bez skóre má váhu 1). Třídy bez viditelných pixelů jsou na konci.
+    """
+    with metrics.span("segment_stats"):
+        stats = label_map.stats()
+    total = max(label_map.index.size, 1)
+    weights = {}
+    for stat in stats:
+        if stat["label"] is None:
+            continue
+        score = stat["score"] if stat["score"] is not None else 1.0
+        weights[stat["label"]] = weights.get(stat["label"], 0.0) + stat["area"] / total * score
+    return sorted(weights, key=lambda label: weights[label], reverse=True)
+
+def draw_segment_boxes(image, label_map, width=2):
+    """Ohraničení segmentů (bbox ze stats) v barvě segmentu"""
+    boxes, colors = [], []
+    for stat, segment in zip(label_map.stats(), label_map.segments):
+        if stat["bbox"] is not None:
+            boxes.append(stat["bbox"])
+            colors.append(tuple(segment["color"][:3]))
+    return draw_masks(image, boxes, width=width, colors=colors)
+
+def render_segments(pil_img, label_map):
+    """Vykreslí segmenty barevnými maskami (jedním vyhledáním v paletě) a vrátí RGB obrázek"""
+    try:
+        with metrics.span("composite"):
+            output_image = label_map.render(pil_img)
+    except Exception as e:
+        st.warning(f"Chyba při zpracování masky: {str(e)}")
+        output_image = pil_img
+
+    # Převedeme zpět na RGB pro zobrazení
+    return output_image.convert("RGB")
+
+def segmentation_cache_key(pil_img):
+    """Klíč cache: hash předzpracovaných pixelů a id modelu (u jiných než HF backendů i název backendu)"""
+    digest = hashlib.sha256()
+    digest.update(get_backend().cache_id.encode("utf-8"))
+    digest.update(f"{pil_img.mode}:{pil_img.size}".encode("utf-8"))
+    digest.update(pil_img.tobytes())
+    return digest.hexdigest()
+
+def _dump_segments(label_map):
+    """Serializace mapy segmentů pro diskovou cache (npz bez pickle)"""
     buffer = BytesIO()
-    pil_img.save(buffer, format="JPEG", quality=90)
-    img_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
+    np.savez_compressed(
+        buffer,
+        index=label_map.index,
+        segments=np.array(json.dumps(label_map.segments))
+    )
+    return buffer.getvalue()
+
+def _load_segments(data):
+    with np.load(BytesIO(data), allow_pickle=False) as arrays:
+        segments = json.loads(str(arrays["segments"][()]))
+        for segment in segments:
+            segment["color"] = tuple(segment["color"])
+        return LabelMap(arrays["index"], segments)
+
+# Sdílená cache výsledků segmentace (napříč reruny i uživateli)
+result_cache = TieredCache(
+    LRUCache(SEGMENT_CACHE_ENTRIES),
+    DiskCache(SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES) if SEGMENT_CACHE_DIR else None,
+    dumps=_dump_segments,
+    loads=_load_segments,
+)
+
+def get_backend():
+    """Aktuální segmentační backend (podle SEGMENTATION_BACKEND v configu)"""
+    return _backend
+
+def set_backend(backend):
+    """Přepne segmentační backend (např. na lokální stub pro testy a benchmarky)"""
+    global _backend
+    _backend = backend
+
+# Shodné souběžné segmentace (stejný obrázek a model) jdou do API jen jednou
+segment_flights = SingleFlight("segment", timeout=SINGLEFLIGHT_TIMEOUT)
+
+def _flight_key(cache_key, hf_token):
+    # Token je v klíči, aby chyba autorizace jednoho uživatele nedopadla na jiného
+    return f"{cache_key}:{hashlib.sha256((hf_token or '').encode('utf-8')).hexdigest()[:16]}"
+
+def fetch_segments(pil_img, hf_token):
+    """
+    Vrátí segmenty obrázku (LabelMap) z cache nebo ze segmentačního backendu.
+    Na rozdíl od segment_image nepoužívá Streamlit a chyby vyhazuje (pro batch zpracování).
+    Když stejný obrázek právě segmentuje jiný požadavek, počká na jeho výsledek.
+    """
+    # Stejný obrázek už mohl někdo segmentovat - zkusíme cache
+    cache_key = segmentation_cache_key(pil_img)
+    segments = result_cache.get(cache_key)
+    if segments is not None:
+        metrics.inc("segment_cache_hits")
+        return segments
+
+    segments, _ = segment_flights.do(
+        _flight_key(cache_key, hf_token), lambda: _fetch_uncached(pil_img, hf_token, cache_key)
+    )
+    return segments
+
+def _fetch_uncached(pil_img, hf_token, cache_key):
+    return _decode_response(get_backend().segment(pil_img, hf_token), pil_img.size, cache_key)
 
-    # API požadavek
-    url = f"https://api-inference.huggingface.co/models/{SEGMENTATION_MODEL['id']}"
-    headers = {"Authorization": f"Bearer {hf_token}"}
+def _decode_response(results, size, cache_key):
+    """Odpověď backendu -> LabelMap (a uložení do cache)"""
+    with metrics.span("decode_masks", segments=len(results) if isinstance(results, list) else 0):
+        segments = parse_segments(results, size)
+
+    # Prázdný výsledek necacheujeme, může jít o přechodný problém API
+    if segments:
+        result_cache.put(cache_key, LabelMap(segments.index, segments.segments))
+    return segments
+
+def fetch_segments_batch(pil_imgs, hf_token, contexts=None):
+    """
+    Segmentace více obrázků najednou (mikro-batching v server.py).
+    Obrázky z cache se znovu neposílají a shodné obrázky v dávce se segmentují jen jednou.
+    Obrázky, které dávka posílá, zaregistruje v segment_flights, takže se k nim připojí souběžné
+    dávky i fetch_segments; na obrázky, které už segmentuje někdo jiný, čeká až po vlastním volání.
+    `contexts` = kontext pro každý obrázek (session v admission), viz admission.session_context.
+    Vrací seznam LabelMap nebo výjimek, po jednom na obrázek.
+    """
+    keys = [segmentation_cache_key(pil_img) for pil_img in pil_imgs]
+    if contexts is None:
+        contexts = [contextvars.copy_context() for _ in pil_imgs]
+    results = {}
+    led = {}
+    joined = {}
+    for key, pil_img, context in zip(keys, pil_imgs, contexts):
+        if key in results or key in led or key in joined:
+            continue
+        segments = result_cache.get(key)
+        if segments is not None:
+            metrics.inc("segment_cache_hits")
+            results[key] = segments
+            continue
+        call, leader = segment_flights.begin(_flight_key(key, hf_token))
+        if leader:
+            led[key] = (pil_img, context, call)
+        else:
+            joined[key] = (pil_img, call)
+
+    if led:
+        flights = list(led.items())
+        try:
+            responses = get_backend().segment_batch(
+                [pil_img for _, (pil_img, _, _) in flights], hf_token, [context for _, (_, context, _) in flights]
+            )
+        except Exception as e:
+            responses = [e] * len(flights)
+        except BaseException:
+            for key, (_, _, call) in flights:
+                segment_flights.finish(_flight_key(key, hf_token), call, abandoned=True)
+            raise
+        for (key, (pil_img, _, call)), response in zip(flights, responses):
+            if not isinstance(response, Exception):
+                try:
+                    response = _decode_response(response, pil_img.size, key)
+                except Exception as e:
+                    response = e
+            results[key] = response
+            if isinstance(response, Exception):
+                segment_flights.finish(_flight_key(key, hf_token), call, error=response)
+            else:
+                segment_flights.finish(_flight_key(key, hf_token), call, result=response)
+
+    # Obrázky, které mezitím segmentuje jiný požadavek - čeká se až po odeslání vlastní dávky
+    for key, (pil_img, call) in joined.items():
+        try:
+            if segment_flights.wait(call):
+                results[key] = call.get()
+            else:
+                # Leader volání opustil - obrázek se segmentuje znovu
+                results[key] = fetch_segments(pil_img, hf_token)
+        except Exception as e:
+            results[key] = e
+    return [results[key] for key in keys]
+
+def fetch_segments_tiled(pil_img, hf_token, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, workers=TILE_WORKERS):
+    """
+    Segmentace ve vysokém rozlišení: obrázek se rozdělí na překrývající se dlaždice,
+    ty se pošlou do API souběžně a výsledky se spojí do jedné LabelMap v plném rozlišení
+    (segmenty stejné třídy se přes švy dlaždic slučují).
+    """
+    boxes = tile_boxes(pil_img.size, tile_size, overlap)
+    if len(boxes) == 1:
+        return fetch_segments(pil_img, hf_token)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile") as pool:
+        # Kopie kontextu, aby požadavky dlaždic patřily stejné session (admission) a trace (metriky)
+        futures = [
+            pool.submit(contextvars.copy_context().run, fetch_segments, pil_img.crop(box), hf_token)
+            for box in boxes
+        ]
+        tile_maps = [future.result() for future in futures]
+
+    label_map = stitch_tiles(pil_img.size, list(zip(boxes, tile_maps)), generate_distinct_colors)
+    label_map.errors = [error for tile_map in tile_maps for error in tile_map.errors]
+    return label_map
+
+def segment_image(image, hf_token, tiled=False, boxes=SEGMENT_DRAW_BOXES):
+    """
+    Segmentuje obrázek pomocí Mask2Former modelu přes Hugging Face API
+    `image` může být PIL Image (z process_image) nebo numpy array
+    Vrací obrázek se segmentačními maskami a unikátní třídy objektů seřazené podle významnosti
+    (plocha vážená skóre, viz rank_labels)
+    S `tiled=True` segmentuje po dlaždicích v plném rozlišení obrázku, s `boxes=True` dokreslí ohraničení segmentů
+    """
+    # Konverze numpy array na PIL Image (PIL Image se použije přímo, bez kopie)
+    pil_img = image if isinstance(image, Image.Image) else Image.fromarray(image)
 
     try:
-        response = requests.post(url, headers=headers, json={"inputs": img_str}, timeout=30)
-        if response.status_code == 200:
-            results = response.json()
-            labels = []
-            
-            # Připravíme výstupní obrázek v RGBA režimu pro překrytí masek
-            output_image = pil_img.convert("RGBA")
-            
-            # Zjistíme počet segmentů a vygenerujeme unikátní barvy
-            n_segments = len(results) if isinstance(results, list) else 0
-            if n_segments > 0:
-                # Vygenerovat unikátní barvy podle počtu segmentů
-                colors = generate_distinct_colors(n_segments)
-                
-                for i, segment in enumerate(results):
-                    if "label" in segment:
-                        label = segment["label"].split(":")[-1].strip()
-                        labels.append(label)
-                    
-                    # Zpracování Base64 kódované masky
-                    if "mask" in segment:
-                        try:
-                            # Dekódování masky
-                            mask_img = decode_base64_mask(segment["mask"])
-                            if mask_img:
-                                # Aplikování barevné masky s unikátní barvou
-                                color = colors[i]
-                                output_image = apply_colored_mask(output_image, mask_img, color)
-                        except Exception as e:
-                            st.warning(f"Chyba při zpracování masky: {str(e)}")
-            
-            # Převedeme zpět na RGB pro zobrazení
-            return output_image.convert("RGB"), list(set(labels))
-        
-        st.error(f"Chyba API: {response.status_code}")
+        # Stažení běží mimo vlákno skriptu, aby šlo průběžně ukazovat pozici ve frontě
+        if tiled:
+            segments = admission.wait_reporting(lambda: fetch_segments_tiled(pil_img, hf_token))
+        else:
+            segments = admission.wait_reporting(lambda: fetch_segments(pil_img, hf_token))
+        if segments.errors:
+            st.warning(f"Chyba při zpracování masky ({len(segments.errors)}×): {'; '.join(segments.errors)}")
+        output_image = render_segments(pil_img, segments)
+        if boxes:
+            output_image = draw_segment_boxes(output_image, segments)
+        return output_image, rank_labels(segments)
+
+    except SegmentationAPIError as e:
+        st.error(f"Chyba API: {e.status_code}")
         return pil_img, []
-    
+
     except Exception as e:
         st.error(f"Chyba při komunikaci s API: {str(e)}")
         return pil_img, []
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import unicodedata
+
+from utils.cache import LRUCache, DiskCache, TieredCache
+from utils.singleflight import SingleFlight
+from config import (
+    STORY_CACHE_ENTRIES, STORY_CACHE_VARIANTS, STORY_CACHE_TTL,
+    STORY_CACHE_DIR, STORY_CACHE_MAX_BYTES, SINGLEFLIGHT_TIMEOUT
+)
+
+
+def normalize_topic(topic):
+    """Sjednotí zápis tématu: Unicode NFC, malá písmena, jedna mezera, bez interpunkce na okrajích"""
+    topic = unicodedata.normalize("NFC", topic).casefold()
+    topic = re.sub(r"\s+", " ", topic)
+    return topic.strip(" .,;:!?\"'")
+
+
+def template_hash(builder):
+    """Hash šablony promptu - změna role, kontextu nebo příkladů znamená nový klíč"""
+    template = json.dumps(
+        [builder.system_role, builder.context, builder.examples],
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+
+
+def story_key(provider, model, topic, temperature, builder):
+    """Klíč cache: poskytovatel, model, normalizované téma, teplota a hash šablony"""
+    return "|".join([provider, model, normalize_topic(topic), f"{temperature:.2f}", template_hash(builder)])
+
+
+class StoryCache:
+    """
+    Cache příběhů s několika variantami na klíč.
+    Dokud klíč nemá `variants` variant, get() vrací None, aby se dogenerovala další.
+    Potom vrací náhodnou variantu, takže uživatel pořád může dostat jiný příběh.
+    Varianty starší než `ttl` sekund se zahazují.
+    """
+    def __init__(self, cache, variants=STORY_CACHE_VARIANTS, ttl=STORY_CACHE_TTL):
+        self.cache = cache
+        self.variants = variants
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _fresh(self, key):
+        entries = self.cache.get(key) or []
+        now = time.time()
+        return [entry for entry in entries if now - entry[0] < self.ttl]
+
+    def get(self, key):
+        """Vrátí jednu z uložených variant, nebo None (je potřeba generovat)"""
+        entries = self._fresh(key)
+        if len(entries) < self.variants:
+            return None
+        return random.choice(entries)[1]
+
+    def add(self, key, text):
+        """Uloží novou variantu příběhu (nejstarší varianty nad limit se zahodí)"""
+        if not text:
+            return
+        with self._lock:
+            entries = self._fresh(key)
+            entries.append([time.time(), text])
+            self.cache.put(key, entries[-self.variants:])
+
+    def clear(self):
+        self.cache.clear()
+
+
+def _dump_entries(entries):
+    return json.dumps(entries, ensure_ascii=False).encode("utf-8")
+
+
+def _load_entries(data):
+    return json.loads(data.decode("utf-8"))
+
+
+# Sdílená cache příběhů (napříč reruny i uživateli)
+story_cache = StoryCache(TieredCache(
+    LRUCache(STORY_CACHE_ENTRIES),
+    DiskCache(STORY_CACHE_DIR, STORY_CACHE_MAX_BYTES) if STORY_CACHE_DIR else None,
+    dumps=_dump_entries,
+    loads=_load_entries,
+))
+
+
+# Shodné souběžné požadavky na příběh (poskytovatel + model + prompt) jdou do API jen jednou
+story_flights = SingleFlight("story", timeout=SINGLEFLIGHT_TIMEOUT)
+
+
+def story_flight_key(cache_key, *api_keys):
+    """
+    Klíč souběžného volání: klíč cache + otisk API klíčů poskytovatelů, aby chyba autorizace
+    jedné session nedopadla na jinou a session bez klíče nedostala příběh za cizí klíč
+    """
+    digest = hashlib.sha256("\0".join(key or "" for key in api_keys).encode("utf-8")).hexdigest()[:16]
+    return f"{cache_key}:{digest}"
+
+
+def generate_story(llm_model, provider, topic, builder, temperature=0.7):
+    """Vrátí příběh z cache, nebo jej vygeneruje a uloží"""
+    key = story_key(provider, llm_model.model, topic, temperature, builder)
+    text = story_cache.get(key)
+    if text is None:
+        def generate():
+            generated = llm_model.generate(builder.build(topic), temperature=temperature)
+            story_cache.add(key, generated)
+            return generated
+
+        text, _ = story_flights.do(story_flight_key(key, llm_model.api_key), generate)
+    return text
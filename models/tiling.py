@@ -0,0 +1,91 @@
+import numpy as np
+
+from models.label_map import LabelMap
+
+
+def tile_boxes(size, tile_size, overlap):
+    """
+    Rozdělí obrázek velikosti `size` (šířka, výška) na překrývající se dlaždice.
+    Vrací seznam boxů (x0, y0, x1, y1); poslední dlaždice v řadě končí přesně na okraji.
+    """
+    width, height = size
+    step = max(tile_size - overlap, 1)
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in starts(height)
+        for x0 in starts(width)
+    ]
+
+
+def stitch_tiles(size, tiles, make_colors, merge_ratio=0.1):
+    """
+    Spojí výsledky dlaždic [(box, LabelMap), ...] do jedné LabelMap v plném rozlišení.
+
+    Segment z nové dlaždice se sloučí s už umístěným segmentem, pokud mají stejný popisek
+    a v překryvu sdílí aspoň `merge_ratio` pixelů nového segmentu v této oblasti.
+    Sloučené segmenty dostanou nejvyšší skóre a nové barvy z `make_colors(n)`.
+    """
+    width, height = size
+    index = np.zeros((height, width), dtype=np.uint32)
+    segments = []
+    parent = []
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for (x0, y0, x1, y1), tile_map in tiles:
+        region = index[y0:y1, x0:x1]
+        local = tile_map.index.astype(np.uint32)
+        offset = len(segments)
+        n_local = len(tile_map.segments)
+        segments.extend({"label": s["label"], "score": s["score"]} for s in tile_map.segments)
+        parent.extend(range(offset, offset + n_local))
+
+        # Páry (lokální segment, globální segment) v překryvu - jedním průchodem přes np.unique
+        both = (local > 0) & (region > 0)
+        if both.any():
+            local_ids = local[both].astype(np.int64) - 1
+            global_ids = region[both].astype(np.int64) - 1
+            local_area = np.bincount(local_ids, minlength=n_local)
+            codes, counts = np.unique(local_ids * offset + global_ids, return_counts=True)
+            for code, count in zip(codes, counts):
+                li, gi = divmod(int(code), offset)
+                if segments[offset + li]["label"] == segments[gi]["label"] and count >= merge_ratio * local_area[li]:
+                    parent[find(offset + li)] = find(gi)
+
+        # region je pohled do `index`, zápis se propíše do celé mapy
+        covered = local > 0
+        region[covered] = local[covered] + offset
+
+    # Přečíslování: každá skupina sloučených segmentů dostane jeden index
+    roots = [find(i) for i in range(len(segments))]
+    new_ids = {}
+    merged = []
+    for i, root in enumerate(roots):
+        if root not in new_ids:
+            new_ids[root] = len(merged)
+            merged.append({"label": segments[root]["label"], "score": segments[root]["score"]})
+        target = merged[new_ids[root]]
+        scores = [score for score in (target["score"], segments[i]["score"]) if score is not None]
+        target["score"] = max(scores) if scores else None
+
+    dtype = np.uint8 if len(merged) < 255 else np.uint16 if len(merged) < 65535 else np.uint32
+    lookup = np.zeros(len(segments) + 1, dtype=dtype)
+    for i, root in enumerate(roots):
+        lookup[i + 1] = new_ids[root] + 1
+
+    for segment, color in zip(merged, make_colors(len(merged))):
+        segment["color"] = tuple(color)
+
+    return LabelMap(lookup[index], merged)
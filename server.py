@@ -0,0 +1,320 @@
+"""
+Samostatná HTTP služba nad pipeline SegmenStory (bez Streamlitu) - pro další frontendy a batch úlohy.
+
+Endpointy:
+    POST /segment   obrázek jako tělo požadavku (image/jpeg, image/png, ...) nebo JSON {"image": Base64}
+                    parametry ?tiled=1 (dlaždice v plném rozlišení), ?boxes=1 (ohraničení segmentů)
+                    -> {"labels": [...], "translations": [...], "segments": [...], "overlay": Base64 JPEG}
+    POST /story     JSON {"topic": "...", "provider": "Perplexity" | "OpenAI" (volitelné), "temperature": 0.7}
+                    -> {"story": "...", "provider": "...", "cached": true/false}
+    GET  /health    stav a délky front
+    GET  /metrics   metriky ve formátu Prometheus
+
+Souběžné segmentace se sbírají do dávek (mikro-batching): shodné obrázky jdou do API jednou
+a dávka se předá backendu najednou. Vykreslování masek se dávkuje zvlášť. Při plné frontě vrací 503.
+
+Příklad:
+    python server.py --port 8700
+    curl --data-binary @foto.jpg -H "Content-Type: image/jpeg" http://127.0.0.1:8700/segment
+"""
+import argparse
+import base64
+import concurrent.futures
+import json
+import os
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import UnidentifiedImageError
+
+import config
+from models import llm, router, segmentation, story_cache
+from models.backends import SegmentationAPIError
+from utils import admission, image_utils, metrics
+from utils.batching import MicroBatcher, Overloaded
+from utils.coco_class_map import translate_many
+from utils.prompt_utils import PromptBuilder
+from utils.session_store import encode_display_image
+
+STORY_TEMPERATURE = 0.7
+
+# API klíče: proměnné prostředí mají přednost před config.py
+HF_TOKEN = os.getenv("HF_API_TOKEN", config.HF_API_TOKEN)
+PER_TOKEN = os.getenv("PER_API_TOKEN", config.PER_API_TOKEN)
+OPENAI_TOKEN = os.getenv("OPENAI_API_KEY", config.OPENAI_API_KEY)
+
+
+def _segment_batch(items):
+    """
+    Dávka segmentací: položky (obrázek, token, tiled, session) se seskupí podle tokenu a režimu.
+    Každá položka běží v kontextu své session, takže admission řadí požadavky po sessions i uvnitř
+    jednoho volání backendu a dávka od více klientů je pořád jedna souběžná dávka.
+    """
+    results = [None] * len(items)
+    contexts = [admission.session_context(session_id) for _, _, _, session_id in items]
+    groups = defaultdict(list)
+    for i, (pil_img, hf_token, tiled, session_id) in enumerate(items):
+        groups[(hf_token, tiled)].append(i)
+
+    for (hf_token, tiled), indexes in groups.items():
+        if tiled:
+            # Obrázky dávky běží souběžně, jejich dlaždice se posílají souběžně uvnitř fetch_segments_tiled
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(indexes), thread_name_prefix="tiled-batch") as pool:
+                futures = {
+                    i: pool.submit(contexts[i].run, segmentation.fetch_segments_tiled, items[i][0], hf_token)
+                    for i in indexes
+                }
+            for i, future in futures.items():
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    results[i] = e
+        else:
+            batch = segmentation.fetch_segments_batch(
+                [items[i][0] for i in indexes], hf_token, [contexts[i] for i in indexes]
+            )
+            for i, result in zip(indexes, batch):
+                results[i] = result
+    return results
+
+
+def _composite_batch(items):
+    """Dávka vykreslení: položky (obrázek, LabelMap, boxes) -> JPEG bytes"""
+    results = []
+    for pil_img, label_map, boxes in items:
+        try:
+            output_image = segmentation.render_segments(pil_img, label_map)
+            if boxes:
+                output_image = segmentation.draw_segment_boxes(output_image, label_map)
+            results.append(encode_display_image(output_image, max_size=max(output_image.size)))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class Service:
+    """Fronty a pracovní vlákna služby (jedna instance na server)"""
+    def __init__(self, batch_window=config.SERVER_BATCH_WINDOW, max_batch=config.SERVER_MAX_BATCH,
+                 segment_workers=config.SERVER_SEGMENT_WORKERS, composite_workers=config.SERVER_COMPOSITE_WORKERS,
+                 story_workers=config.SERVER_STORY_WORKERS, max_queue=config.SERVER_MAX_QUEUE,
+                 request_timeout=config.SERVER_REQUEST_TIMEOUT):
+        self.request_timeout = request_timeout
+        self.segmenter = MicroBatcher(_segment_batch, max_batch, batch_window, segment_workers, max_queue, name="segment_batch")
+        self.compositor = MicroBatcher(_composite_batch, max_batch, batch_window, composite_workers, max_queue, name="composite_batch")
+        # Příběhy se nedávkují (každý je jiný prompt) - jen omezený počet souběžných volání a čekajících
+        self._story_running = threading.Semaphore(story_workers)
+        self._story_admitted = threading.BoundedSemaphore(story_workers + max_queue)
+        self._llms = {}
+        self._llms_lock = threading.Lock()
+
+    def segment(self, image_bytes, hf_token, tiled=False, boxes=False, session_id="default"):
+        max_size = config.TILED_MAX_SIZE if tiled else 512
+        with metrics.span("process_image"):
+            pil_img = image_utils.process_image_bytes(image_bytes, max_size)
+
+        label_map = self._result(self.segmenter.submit((pil_img, hf_token, tiled, session_id)))
+        overlay = self._result(self.compositor.submit((pil_img, label_map, boxes)))
+
+        labels = segmentation.rank_labels(label_map)
+        return {
+            "labels": labels,
+            "translations": translate_many(labels),
+            "segments": label_map.stats(),
+            "mask_errors": label_map.errors,
+            "overlay": base64.b64encode(overlay).decode("utf-8"),
+        }
+
+    def _result(self, future):
+        """Výsledek z fronty; po vypršení se položka zruší, aby se už nezpracovávala (klient dostal 504)"""
+        try:
+            return future.result(timeout=self.request_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def _get_llm(self, provider):
+        with self._llms_lock:
+            if provider not in self._llms:
+                if provider == "Perplexity":
+                    self._llms[provider] = llm.PerplexityLLM(api_key=PER_TOKEN)
+                else:
+                    self._llms[provider] = llm.OpenAILLM(api_key=OPENAI_TOKEN)
+            return self._llms[provider]
+
+    def build_router(self, preferred=None):
+        providers = {}
+        if PER_TOKEN:
+            providers["Perplexity"] = self._get_llm("Perplexity")
+        if OPENAI_TOKEN:
+            providers["OpenAI"] = self._get_llm("OpenAI")
+        if not providers:
+            providers["Perplexity"] = self._get_llm("Perplexity")
+        return router.LLMRouter(providers, preferred)
+
+    def story(self, topic, preferred=None, temperature=STORY_TEMPERATURE, session_id="default"):
+        if not self._story_admitted.acquire(blocking=False):
+            metrics.inc("story_rejected")
+            raise Overloaded("Příliš mnoho čekajících požadavků na příběh")
+        try:
+            if not self._story_running.acquire(timeout=self.request_timeout):
+                raise TimeoutError()
+            try:
+                with admission.session(session_id):
+                    return self._generate_story(topic, preferred, temperature)
+            finally:
+                self._story_running.release()
+        finally:
+            self._story_admitted.release()
+
+    def _generate_story(self, topic, preferred, temperature):
+        builder = PromptBuilder()
+        llm_router = self.build_router(preferred)
+        provider = llm_router.order()[0]
+        cache_key = story_cache.story_key(provider, llm_router.providers[provider].model, topic, temperature, builder)
+        text = story_cache.story_cache.get(cache_key)
+        if text is not None:
+            return {"story": text, "provider": provider, "cached": True}
+
+        def generate():
+            with metrics.span("llm_generate", provider="router"):
+                text = llm_router.generate(builder.build(topic), temperature=temperature)
+            used_model = llm_router.providers[llm_router.last_provider]
+            story_cache.story_cache.add(
+                story_cache.story_key(llm_router.last_provider, used_model.model, topic, temperature, builder), text
+            )
+            return text, llm_router.last_provider
+
+        # Shodné souběžné požadavky čekají na jedno volání LLM
+        flight_key = story_cache.story_flight_key(cache_key, *(model.api_key for model in llm_router.providers.values()))
+        (text, used_provider), _ = story_cache.story_flights.do(flight_key, generate)
+        return {"story": text, "provider": used_provider, "cached": False}
+
+    def health(self):
+        return {
+            "status": "ok",
+            "segment_queue": self.segmenter.qsize(),
+            "composite_queue": self.compositor.qsize(),
+        }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Nastavuje se v make_server()
+    service = None
+    quiet = False
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8", headers)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def _hf_token(self):
+        authorization = self.headers.get("Authorization", "")
+        if authorization.startswith("Bearer "):
+            return authorization[len("Bearer "):]
+        return HF_TOKEN
+
+    def _session_id(self):
+        """Klient pro férové fronty k API: hlavička X-Session-Id, jinak IP adresa"""
+        return self.headers.get("X-Session-Id") or self.client_address[0]
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(200, self.service.health())
+        elif path == "/metrics":
+            self._send(200, metrics.render_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        body = self._read_body()
+        trace = metrics.start_trace(parts.path)
+        try:
+            if parts.path == "/segment":
+                tiled = query.get("tiled", ["0"])[0] == "1"
+                boxes = query.get("boxes", ["0"])[0] == "1"
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    payload = json.loads(body)
+                    body = base64.b64decode(payload["image"])
+                    tiled = payload.get("tiled", tiled)
+                    boxes = payload.get("boxes", boxes)
+                self._send_json(200, self.service.segment(body, self._hf_token(), tiled, boxes, self._session_id()))
+            elif parts.path == "/story":
+                payload = json.loads(body or b"{}")
+                topic = str(payload.get("topic", "")).strip()
+                if not topic:
+                    self._send_json(400, {"error": "Chybí téma (topic)"})
+                    return
+                self._send_json(200, self.service.story(
+                    topic, payload.get("provider"), float(payload.get("temperature", STORY_TEMPERATURE)),
+                    self._session_id(),
+                ))
+            else:
+                self._send_json(404, {"error": "Not found"})
+        except Overloaded as e:
+            self._send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+        except (TimeoutError, concurrent.futures.TimeoutError):
+            # Na Pythonu < 3.11 jde o dvě různé třídy: futures vs. čekání v SingleFlight a na semaforu
+            self._send_json(504, {"error": "Vypršel čas na zpracování požadavku"})
+        except SegmentationAPIError as e:
+            self._send_json(502, {"error": str(e), "upstream_status": e.status_code})
+        except (ValueError, KeyError, UnidentifiedImageError) as e:
+            self._send_json(400, {"error": f"Neplatný požadavek: {e}"})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+        finally:
+            metrics.finish_trace(trace)
+
+
+def make_server(host=config.SERVER_HOST, port=config.SERVER_PORT, service=None, quiet=False):
+    """Vytvoří (nespuštěný) server - použitelné i z testů a zátěžových skriptů"""
+    handler = type("ConfiguredServiceHandler", (ServiceHandler,), {"service": service or Service(), "quiet": quiet})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP služba SegmenStory (/segment, /story)")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--batch-window", type=float, default=config.SERVER_BATCH_WINDOW, help="Okno pro sběr dávky (s)")
+    parser.add_argument("--max-batch", type=int, default=config.SERVER_MAX_BATCH, help="Maximální velikost dávky")
+    parser.add_argument("--segment-workers", type=int, default=config.SERVER_SEGMENT_WORKERS, help="Souběžně zpracovávané dávky segmentace")
+    parser.add_argument("--composite-workers", type=int, default=config.SERVER_COMPOSITE_WORKERS, help="Vlákna pro vykreslování masek")
+    parser.add_argument("--story-workers", type=int, default=config.SERVER_STORY_WORKERS, help="Souběžná volání LLM")
+    parser.add_argument("--max-queue", type=int, default=config.SERVER_MAX_QUEUE, help="Délka fronty, nad kterou se vrací 503")
+    parser.add_argument("--quiet", action="store_true", help="Nevypisovat jednotlivé požadavky")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    service = Service(args.batch_window, args.max_batch, args.segment_workers, args.composite_workers,
+                      args.story_workers, args.max_queue)
+    server = make_server(args.host, args.port, service, args.quiet)
+    print(f"SegmenStory služba běží na http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
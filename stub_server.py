@@ -0,0 +1,216 @@
+"""
+Lokální zástupný server za segmentační a LLM API pro běh bez sítě (testy, benchmarky, zátěžové testy).
+
+Odpovídá na POST /models/<id modelu> ve stejném formátu jako Hugging Face Inference API
+(seznam segmentů s "label", "score" a Base64 PNG "mask"). Odpovědi jsou buď nahrané
+(--record soubor.json s uloženou odpovědí HF), nebo syntetické (--segments N).
+
+Na POST .../chat/completions odpovídá jako OpenAI-kompatibilní chat API (Perplexity, OpenAI),
+včetně streamování přes server-sent events. Příběh má --story-words slov, při streamování
+přichází po --chunk-words slovech s prodlevou --chunk-delay ms.
+
+Příklad:
+    python stub_server.py --port 8600 --segments 12 --latency 300
+    SEGMENTATION_BACKEND=local-http PERPLEXITY_BASE_URL=http://127.0.0.1:8600 streamlit run app.py
+"""
+import argparse
+import base64
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+from models.backends import synthetic_panoptic_response
+
+STORY_WORDS = (
+    "Kdysi dávno v pravěku si jeden zvídavý lovec všiml, že tahle věc ušetří spoustu práce. "
+    "Kmen ji nejdřív podezíravě očichával, pak ji vyměnil za tři mamutí kožešiny a od té doby "
+    "se bez ní neobejde žádná jeskyně. Archeologové dodnes tvrdí, že právě ona stojí za vznikem civilizace."
+).split()
+
+
+def synthetic_story(words, seed=0):
+    """Syntetický příběh o `words` slovech (deterministický podle seed)"""
+    rng = random.Random(seed)
+    start = rng.randrange(len(STORY_WORDS))
+    return " ".join(STORY_WORDS[(start + i) % len(STORY_WORDS)] for i in range(words))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Nastavuje se v make_server()
+    options = None
+    recorded = None
+
+    def log_message(self, format, *args):
+        if not self.options.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def _simulate_latency(self):
+        latency = self.options.latency + random.uniform(0, self.options.jitter)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def _inject_error(self):
+        """S pravděpodobností --error-rate vrátí 503 jako HF při načítání modelu"""
+        if random.random() < self.options.error_rate:
+            self._send_json(
+                503,
+                {"error": "Model is currently loading", "estimated_time": self.options.estimated_time},
+                {"Retry-After": str(int(self.options.estimated_time))},
+            )
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self._chat_completions(body)
+            return
+        if not self.path.startswith("/models/"):
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        self._simulate_latency()
+        if self._inject_error():
+            return
+
+        # Obrázek jako JSON {"inputs": Base64} nebo přímo binární data
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            image_bytes = base64.b64decode(json.loads(body)["inputs"])
+        else:
+            image_bytes = body
+        try:
+            size = Image.open(BytesIO(image_bytes)).size
+        except Exception as e:
+            self._send_json(400, {"error": f"Neplatný obrázek: {e}"})
+            return
+
+        if self.recorded is not None:
+            self._send_json(200, self.recorded)
+        else:
+            self._send_json(200, synthetic_panoptic_response(size, self.options.segments, seed=len(image_bytes)))
+
+    def _chat_completions(self, body):
+        """OpenAI-kompatibilní chat completions (stejný formát jako Perplexity a OpenAI)"""
+        try:
+            payload = json.loads(body)
+            prompt = payload["messages"][-1]["content"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            self._send_json(400, {"error": {"message": f"Neplatný požadavek: {e}"}})
+            return
+
+        self._simulate_latency()
+        if self._inject_error():
+            return
+
+        model = payload.get("model", "stub")
+        words = synthetic_story(self.options.story_words, seed=len(prompt)).split(" ")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        if not payload.get("stream"):
+            text = " ".join(words)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(words), "total_tokens": len(prompt.split()) + len(words)},
+            })
+            return
+
+        # Server-sent events bez Content-Length - konec odpovědi určí uzavření spojení
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            step = max(self.options.chunk_words, 1)
+            for i in range(0, len(words), step):
+                if i and self.options.chunk_delay > 0:
+                    time.sleep(self.options.chunk_delay / 1000)
+                event({"content": ("" if i == 0 else " ") + " ".join(words[i:i + step])})
+            event({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Klient stream zavřel dřív (např. zrušená session)
+            pass
+
+
+def make_server(options):
+    """Vytvoří (nespuštěný) server - použitelné i z testů a zátěžových skriptů"""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"options": options})
+    if options.record:
+        with open(options.record, encoding="utf-8") as f:
+            handler.recorded = json.load(f)
+    return ThreadingHTTPServer((options.host, options.port), handler)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Lokální zástupný server za segmentační a LLM API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--segments", type=int, default=8, help="Počet syntetických segmentů")
+    parser.add_argument("--record", help="JSON soubor s nahranou odpovědí Hugging Face API")
+    parser.add_argument("--latency", type=float, default=0, help="Umělá latence v ms")
+    parser.add_argument("--jitter", type=float, default=0, help="Náhodná přidaná latence 0..N ms")
+    parser.add_argument("--error-rate", type=float, default=0, help="Podíl odpovědí 503 (0-1)")
+    parser.add_argument("--estimated-time", type=float, default=2.0, help="estimated_time v odpovědi 503")
+    parser.add_argument("--story-words", type=int, default=120, help="Délka syntetického příběhu ve slovech")
+    parser.add_argument("--chunk-words", type=int, default=4, help="Slov v jednom chunku při streamování")
+    parser.add_argument("--chunk-delay", type=float, default=0, help="Prodleva mezi chunky streamu v ms")
+    parser.add_argument("--quiet", action="store_true", help="Nevypisovat jednotlivé požadavky")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    server = make_server(options)
+    print(f"Stub server běží na http://{options.host}:{options.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
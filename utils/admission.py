@@ -0,0 +1,284 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from utils import metrics
+from utils.batching import Overloaded
+from config import (
+    ADMISSION_LIMITS, ADMISSION_MAX_QUEUE_PER_SESSION, ADMISSION_MAX_WAITING, ADMISSION_TIMEOUT
+)
+
+# Session a stav čekání ve frontě pro aktuální požadavek (nastavuje session())
+_current_session = contextvars.ContextVar("segmenstory_session", default="default")
+_current_status = contextvars.ContextVar("segmenstory_wait_status", default=None)
+
+
+class WaitStatus:
+    """
+    Sdílený stav čekání jedné session: pozice a odhad pro každý její čekající požadavek
+    (i z vláken dlaždic a hedgingu, kam se kontext kopíruje). Callback `on_wait` se volá
+    jen ve vlákně, které session otevřelo - ve Streamlitu jen tam funguje vykreslování.
+    """
+    def __init__(self, on_wait=None):
+        self.on_wait = on_wait
+        self._owner = threading.get_ident()
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    def update(self, ticket, position, estimate):
+        with self._lock:
+            self._waiting[ticket] = (position, estimate)
+        if self.on_wait is not None and threading.get_ident() == self._owner:
+            self.on_wait(*self.snapshot())
+
+    def remove(self, ticket):
+        with self._lock:
+            self._waiting.pop(ticket, None)
+
+    def snapshot(self):
+        """(nejlepší pozice, nejdelší odhad) přes čekající požadavky, nebo None"""
+        with self._lock:
+            if not self._waiting:
+                return None
+            return (
+                min(position for position, _ in self._waiting.values()),
+                max(estimate for _, estimate in self._waiting.values()),
+            )
+
+
+class TokenBucket:
+    """
+    Token bucket: `rate` jednotek za sekundu, nejvýš `capacity` najednou (burst).
+    Není thread-safe sám o sobě - volá se pod zámkem AdmissionController.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def delay(self, amount):
+        """Za kolik sekund bude k dispozici `amount` jednotek (víc než capacity se nikdy nenaplní)"""
+        amount = min(amount, self.capacity)
+        missing = amount - self.available()
+        return max(missing / self.rate, 0.0)
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Ticket:
+    __slots__ = ("session_id", "tokens")
+
+    def __init__(self, session_id, tokens):
+        self.session_id = session_id
+        self.tokens = tokens
+
+
+class AdmissionController:
+    """
+    Řízení přístupu k jednomu poskytovateli: token bucket na požadavky za sekundu a volitelně
+    na LLM tokeny za minutu. Čekající požadavky jsou ve frontách po sessions a pouští se
+    střídavě (round-robin), takže jedna session s mnoha požadavky nezablokuje ostatní.
+    Každá session smí mít ve frontě nejvýš `max_queue_per_session` požadavků, celkem `max_waiting`.
+    """
+    def __init__(self, name, requests_per_second, burst=1, tokens_per_minute=None,
+                 max_queue_per_session=ADMISSION_MAX_QUEUE_PER_SESSION, max_waiting=ADMISSION_MAX_WAITING):
+        self.name = name
+        self.requests = TokenBucket(requests_per_second, burst)
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.max_queue_per_session = max_queue_per_session
+        self.max_waiting = max_waiting
+        # session_id -> fronta lístků; pořadí klíčů je pořadí round-robin
+        self._queues = OrderedDict()
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    def _next_ticket(self):
+        for queue in self._queues.values():
+            return queue[0]
+        return None
+
+    def _delay(self, tokens):
+        delay = self.requests.delay(1)
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.delay(tokens))
+        return delay
+
+    def _position(self, ticket):
+        """Kolik požadavků půjde před tímto lístkem (při střídání sessions)"""
+        own_index = self._queues[ticket.session_id].index(ticket)
+        ahead = 0
+        ahead_tokens = 0
+        before_own = True
+        for session_id, queue in self._queues.items():
+            if session_id == ticket.session_id:
+                before_own = False
+                ahead += own_index
+                ahead_tokens += sum(t.tokens for t in list(queue)[:own_index])
+                continue
+            # Sessions před námi v pořadí dostanou v našem kole ještě jeden požadavek navíc
+            count = min(len(queue), own_index + 1 if before_own else own_index)
+            ahead += count
+            ahead_tokens += sum(t.tokens for t in list(queue)[:count])
+        return ahead, ahead_tokens
+
+    def _estimate(self, ticket):
+        ahead, ahead_tokens = self._position(ticket)
+        wait = max((ahead + 1 - self.requests.available()) / self.requests.rate, 0.0)
+        if self.tokens is not None and ticket.tokens:
+            missing = ahead_tokens + min(ticket.tokens, self.tokens.capacity) - self.tokens.available()
+            wait = max(wait, missing / self.tokens.rate)
+        return ahead + 1, wait
+
+    def status(self):
+        with self._cond:
+            return {
+                "waiting": self._waiting,
+                "sessions": len(self._queues),
+                "requests_available": self.requests.available(),
+                "tokens_available": self.tokens.available() if self.tokens is not None else None,
+            }
+
+    def acquire(self, session_id="default", tokens=0, timeout=ADMISSION_TIMEOUT, status=None, block=True):
+        """
+        Počká, až požadavek smí odejít k poskytovateli (a odečte ho z bucketů).
+        Pozici a odhad čekání průběžně zapisuje do `status` (WaitStatus), např. pro zobrazení v UI.
+        S `block=False` nebo při plné frontě / vypršení `timeout` vyhodí Overloaded.
+        """
+        ticket = _Ticket(session_id, tokens)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            queue = self._queues.get(session_id)
+            if queue is not None and len(queue) >= self.max_queue_per_session:
+                metrics.inc(f"admission_{self.name}_rejected")
+                raise Overloaded("Příliš mnoho souběžných požadavků z jedné session, počkej na dokončení předchozích")
+            if self._waiting >= self.max_waiting:
+                metrics.inc(f"admission_{self.name}_rejected")
+                raise Overloaded(f"Fronta na {self.name} je plná, zkus to prosím za chvíli")
+            if queue is None:
+                queue = self._queues[session_id] = deque()
+            queue.append(ticket)
+            self._waiting += 1
+
+        start = time.monotonic()
+        try:
+            while True:
+                with self._cond:
+                    if self._next_ticket() is ticket:
+                        wait = self._delay(tokens)
+                        if wait <= 0:
+                            self.requests.consume(1)
+                            if self.tokens is not None and tokens:
+                                self.tokens.consume(tokens)
+                            self._dequeue(ticket)
+                            metrics.record(f"admission_wait_{self.name}", time.monotonic() - start)
+                            return
+                    else:
+                        wait = None
+                    if not block:
+                        raise Overloaded(f"{self.name}: limit požadavků je vyčerpaný")
+                    if deadline is not None and time.monotonic() >= deadline:
+                        metrics.inc(f"admission_{self.name}_timeouts")
+                        raise Overloaded(f"Na {self.name} se čeká příliš dlouho, zkus to prosím za chvíli")
+                    position, estimate = self._estimate(ticket)
+                    self._cond.wait(min(wait, 0.5) if wait is not None else 0.5)
+                if status is not None:
+                    status.update(ticket, position, estimate)
+        except BaseException:
+            with self._cond:
+                if ticket in self._queues.get(session_id, ()):
+                    self._dequeue(ticket)
+            raise
+        finally:
+            if status is not None:
+                status.remove(ticket)
+
+    def _dequeue(self, ticket):
+        """Odebere lístek a posune jeho session na konec pořadí (round-robin). Volá se pod zámkem."""
+        queue = self._queues[ticket.session_id]
+        queue.remove(ticket)
+        self._waiting -= 1
+        del self._queues[ticket.session_id]
+        if queue:
+            self._queues[ticket.session_id] = queue
+        self._cond.notify_all()
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(provider):
+    """Sdílený controller pro poskytovatele podle ADMISSION_LIMITS (bez limitu v configu None)"""
+    with _controllers_lock:
+        if provider not in _controllers:
+            limits = ADMISSION_LIMITS.get(provider)
+            _controllers[provider] = AdmissionController(provider, **limits) if limits else None
+        return _controllers[provider]
+
+
+@contextmanager
+def session(session_id, on_wait=None):
+    """
+    Požadavky uvnitř bloku patří dané session (fronty). Čekání ve frontě hlásí `on_wait(pozice, odhad)`
+    ve vlákně, které blok otevřelo (pro práci v jiných vláknech viz wait_reporting).
+    """
+    status = WaitStatus(on_wait)
+    session_token = _current_session.set(session_id)
+    status_token = _current_status.set(status)
+    try:
+        yield status
+    finally:
+        _current_session.reset(session_token)
+        _current_status.reset(status_token)
+
+
+def session_context(session_id):
+    """
+    Kopie aktuálního kontextu, ve které požadavky patří session `session_id` - pro práci
+    více sessions, která se předává jiným vláknům (dávka v server.py): `context.run(fn, ...)`.
+    """
+    context = contextvars.copy_context()
+    context.run(_current_session.set, session_id)
+    context.run(_current_status.set, WaitStatus(None))
+    return context
+
+
+def admit(provider, tokens=0, block=True):
+    """Počká na povolení odeslat požadavek na poskytovatele (volá se těsně před každým pokusem)"""
+    controller = get_controller(provider)
+    if controller is None:
+        return
+    controller.acquire(_current_session.get(), tokens, status=_current_status.get(), block=block)
+
+
+def wait_reporting(fn, interval=0.25):
+    """
+    Provede `fn()` v pomocném vlákně (se stejnou session) a volající vlákno mezitím každých
+    `interval` sekund předává stav fronty do `on_wait` aktuální session. Pro práci, která čeká
+    ve frontě v jiných vláknech (dlaždice), zatímco UI jde vykreslovat jen z volajícího vlákna.
+    """
+    status = _current_status.get()
+    if status is None or status.on_wait is None:
+        return fn()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="admission-wait") as pool:
+        future = pool.submit(contextvars.copy_context().run, fn)
+        while not wait([future], timeout=interval).done:
+            snapshot = status.snapshot()
+            if snapshot is not None:
+                status.on_wait(*snapshot)
+        return future.result()
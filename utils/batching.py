@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from utils import metrics
+
+
+class Overloaded(Exception):
+    """Fronta je plná - klient to má zkusit později (server vrací 503)"""
+
+
+class MicroBatcher:
+    """
+    Sbírá souběžné požadavky po dobu `window` sekund (nebo do `max_batch` položek)
+    a zpracuje je najednou funkcí `process(items)`, která vrací seznam výsledků
+    nebo výjimek - po jednom na položku. `workers` vláken zpracovává dávky souběžně.
+    Fronta má nejvýše `max_queue` čekajících položek, další submit() vyhodí Overloaded.
+    """
+    def __init__(self, process, max_batch=8, window=0.01, workers=1, max_queue=64, name="batch"):
+        self.process = process
+        self.max_batch = max_batch
+        self.window = window
+        self.max_queue = max_queue
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item):
+        """Zařadí položku a vrátí Future s jejím výsledkem"""
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            metrics.inc(f"{self.name}_rejected")
+            raise Overloaded(f"Fronta '{self.name}' je plná ({self.max_queue} požadavků)")
+        return future
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        """Počká na první položku a pak do konce okna přibírá další"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Položky, které klient mezitím zrušil (timeout), se už nezpracují
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            metrics.inc(f"{self.name}_batches")
+            metrics.inc(f"{self.name}_items", len(batch))
+            try:
+                with metrics.span(self.name, size=len(batch)):
+                    results = self.process([item for item, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class LRUCache:
+    """Jednoduchá thread-safe LRU cache v paměti."""
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Vrátí hodnotu pro klíč (nebo None) a označí ji jako naposledy použitou."""
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        """Uloží hodnotu a případně vyhodí nejdéle nepoužitou položku."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """
+    Cache na disku - jeden soubor na klíč.
+    Při překročení `max_bytes` maže soubory od nejdéle nepoužitých (podle mtime).
+    """
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        # Název souboru odvodíme z hashe, aby klíč mohl obsahovat libovolné znaky
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / f"{digest}.bin"
+
+    def get(self, key):
+        """Vrátí uložená data (bytes), nebo None."""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        # Aktualizace mtime slouží jako záznam posledního přístupu pro eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Atomicky zapíše data a případně uvolní místo."""
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".tmp{threading.get_ident()}")
+        with self._lock:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+            self._evict()
+
+    def delete(self, key):
+        """Smaže položku (pokud existuje)."""
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for path in self.directory.glob("*.bin"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for path in self.directory.glob("*.bin"):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+
+class TieredCache:
+    """
+    Dvouúrovňová cache: LRU v paměti a volitelně cache na disku.
+    Hodnoty se na disk ukládají přes `dumps`/`loads` (výchozí je pickle).
+    Počítá zásahy (hits) pro jednotlivé úrovně a výpadky (misses).
+    """
+    def __init__(self, memory, disk=None, dumps=pickle.dumps, loads=pickle.loads):
+        self.memory = memory
+        self.disk = disk
+        self.dumps = dumps
+        self.loads = loads
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    def _count(self, tier=None):
+        with self._lock:
+            if tier is None:
+                self.misses += 1
+            else:
+                self.hits[tier] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory")
+            return value
+
+        if self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                try:
+                    value = self.loads(data)
+                except Exception:
+                    value = None
+                if value is not None:
+                    # Povýšení do paměťové úrovně
+                    self.memory.put(key, value)
+                    self._count("disk")
+                    return value
+
+        self._count()
+        return None
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, self.dumps(value))
+            except OSError:
+                # Selhání disku nesmí shodit požadavek, paměťová úroveň stačí
+                pass
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        """Vrátí počty zásahů a výpadků."""
+        with self._lock:
+            total = sum(self.hits.values()) + self.misses
+            return {
+                "hits_memory": self.hits["memory"],
+                "hits_disk": self.hits["disk"],
+                "misses": self.misses,
+                "hit_rate": (sum(self.hits.values()) / total) if total else 0.0,
+            }
@@ -1,3 +1,6 @@
+import json
+from pathlib import Path
+
 COCO_CLASS_TRANSLATION = {
     "person": "osoba",
     "bicycle": "jízdní kolo",
@@ -189,7 +192,123 @@ COCO_CLASS_TRANSLATION = {
     "floor": "podlaha"
 }
 
+# Přípony, kterými Mask2Former (COCO panoptic) rozlišuje varianty stejné třídy
+LABEL_SUFFIXES = ("-merged", "-other", "-stuff")
+# Předpony, které některé modely přidávají před název třídy
+LABEL_PREFIXES = ("stuff-", "thing-", "things-")
+
+
+def normalize_label(label: str) -> str:
+    """Sjednotí zápis třídy: malá písmena, podtržítka jako mezery, bez okrajových mezer"""
+    return label.strip().lower().replace("_", " ")
+
+
+class TranslationIndex:
+    """
+    Překladová tabulka tříd. Při vytvoření předpočítá všechny známé varianty názvů
+    ('-merged', '-other-merged', '-stuff', ...), takže překlad je jedno vyhledání ve slovníku.
+    Neznámé názvy se přeloží postupným odebíráním přípon/předpon a výsledek se zapamatuje.
+    """
+    def __init__(self, translations):
+        self.translations = {}
+        self.update(translations)
+
+    def update(self, translations):
+        """Přidá nebo přepíše překlady (např. z dalšího jazykového souboru)"""
+        self.translations.update({normalize_label(label): text for label, text in translations.items()})
+        # Nejdřív varianty, pak přesné názvy - přesný název ze slovníku má vždy přednost
+        index = {}
+        for label, text in self.translations.items():
+            for suffix in ("-merged", "-other-merged", "-stuff", "-other", "-stuff-merged"):
+                index.setdefault(label + suffix, text)
+        for label, text in self.translations.items():
+            index[label] = text
+        self._index = index
+
+    def _resolve(self, label):
+        candidates = [label]
+        for prefix in LABEL_PREFIXES:
+            if label.startswith(prefix):
+                candidates.append(label[len(prefix):])
+        for candidate in list(candidates):
+            stripped = candidate
+            while True:
+                for suffix in LABEL_SUFFIXES:
+                    if stripped.endswith(suffix):
+                        stripped = stripped[:-len(suffix)]
+                        candidates.append(stripped)
+                        break
+                else:
+                    break
+            # Původní chování: základ před první pomlčkou
+            candidates.append(candidate.split("-")[0])
+        for candidate in candidates:
+            if candidate in self._index:
+                return self._index[candidate]
+        return None
+
+    def lookup(self, label):
+        """Překlad třídy, nebo None, když ji neznáme"""
+        key = normalize_label(label)
+        if key in self._index:
+            return self._index[key]
+        translated = self._resolve(key)
+        if translated is not None:
+            self._index[key] = translated
+        return translated
+
+    def translate(self, label):
+        """Překlad třídy; neznámá třída se vrátí beze změny"""
+        translated = self.lookup(label)
+        return label if translated is None else translated
+
+    def translate_many(self, labels):
+        """
+        Přeloží seznam tříd najednou. Výsledky jsou bez duplicit a ve stabilním pořadí
+        (podle prvního výskytu). Každý obsahuje i původní názvy tříd, které se na něj přeložily:
+        [{"translated": "zeď", "labels": ["wall-brick", "wall-other-merged"], "known": True}, ...]
+        """
+        results = {}
+        for label in labels:
+            translated = self.lookup(label)
+            text = label if translated is None else translated
+            entry = results.get(text)
+            if entry is None:
+                entry = results[text] = {"translated": text, "labels": [], "known": translated is not None}
+            if label not in entry["labels"]:
+                entry["labels"].append(label)
+        return list(results.values())
+
+
+# Překladové indexy podle jazyka
+INDEXES = {"cs": TranslationIndex(COCO_CLASS_TRANSLATION)}
+DEFAULT_LOCALE = "cs"
+
+
+def get_index(locale=DEFAULT_LOCALE):
+    return INDEXES[locale]
+
+
+def load_locale(path, locale=None):
+    """
+    Načte překlady tříd z JSON souboru ({"třída": "překlad", ...}). Jazyk se bere z názvu
+    souboru (např. en.json), existující jazyk se doplní, nový se vytvoří.
+    """
+    path = Path(path)
+    locale = locale or path.stem
+    with open(path, encoding="utf-8") as f:
+        translations = json.load(f)
+    if locale in INDEXES:
+        INDEXES[locale].update(translations)
+    else:
+        INDEXES[locale] = TranslationIndex(translations)
+    return INDEXES[locale]
+
+
+def translate_many(labels, locale=DEFAULT_LOCALE):
+    return get_index(locale).translate_many(labels)
+
+
 def preprocess_class_name(orig_label: str) -> str:
     """Zpracuje názvy tříd s příponami jako '-merged' nebo '-other-merged'"""
-    base_label = orig_label.split('-')[0]
-    return COCO_CLASS_TRANSLATION.get(base_label, orig_label)
\ No newline at end of file
+    return get_index().translate(orig_label)
\ No newline at end of file
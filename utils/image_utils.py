@@ -1,25 +1,50 @@
-from PIL import Image
+from PIL import Image, ImageOps
 from io import BytesIO
-import numpy as np
 
-def process_image(uploaded_file):
+# JPEG se dekóduje rovnou zmenšený (DCT škálování), ale aspoň na dvojnásobek cílové velikosti,
+# aby následné zmenšení mělo z čeho brát (stejně jako reducing_gap v Image.thumbnail)
+DRAFT_REDUCING_GAP = 2
+
+def process_image(uploaded_file, max_size=512):
     """
     Zpracuje nahraný soubor obrázku
     
     Args:
         uploaded_file: Souborový objekt ze Streamlit file_uploader
+        max_size: Maximální délka delší strany (512 pro jeden požadavek, víc pro segmentaci po dlaždicích)
         
     Returns:
-        numpy array reprezentace obrazu
+        PIL Image v režimu RGB
+    """
+    return process_image_bytes(uploaded_file.getvalue(), max_size)
+
+def process_image_bytes(img_bytes, max_size=512):
+    """
+    Zpracuje obrázek zadaný jako bytes (např. soubor načtený z disku v batch režimu)
+
+    Returns:
+        PIL Image v režimu RGB
     """
-    img_bytes = uploaded_file.getvalue()
     img = Image.open(BytesIO(img_bytes))
-    
+
+    # U JPEG se plné rozlišení vůbec nedekóduje - 24 Mpx fotka z mobilu se načte rovnou jako ~1.5 Mpx
+    # Musí být před exif_transpose, které obrázek načte
+    if img.format == "JPEG":
+        img.draft("RGB", (max_size * DRAFT_REDUCING_GAP, max_size * DRAFT_REDUCING_GAP))
+
+    # Otočení podle EXIF (fotky z mobilu jsou jinak často naležato)
+    img = ImageOps.exif_transpose(img)
+
+    # Paletové a další režimy převést před zmenšením (paleta se jinak zmenšuje jen metodou nearest)
+    if img.mode not in ("RGB", "RGBA", "L"):
+        has_alpha = img.mode in ("LA", "PA") or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
     # Zmenšení obrázku na mnohem menší velikost pro API (namísto 1920x1080) Hugging Face API má omezení velikosti payloadu
-    img.thumbnail((512, 512))
+    img.thumbnail((max_size, max_size))
     
-    # Převod na RGB formát pokud obsahuje alfa kanál (průhlednost)
-    if img.mode == 'RGBA':
+    # Převod na RGB formát (alfa kanál, odstíny šedi)
+    if img.mode != 'RGB':
         img = img.convert('RGB')
     
-    return np.array(img)
\ No newline at end of file
+    return img
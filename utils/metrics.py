@@ -0,0 +1,181 @@
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from config import METRICS_ENABLED, METRICS_LOG, METRICS_FILE
+
+logger = logging.getLogger("segmenstory.metrics")
+
+# Hranice histogramu latencí v sekundách
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = METRICS_ENABLED
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_current_trace = contextvars.ContextVar("segmenstory_trace", default=None)
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+class Trace:
+    """Časy fází jednoho požadavku (pro ladicí panel a strukturované logy)"""
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self.started = time.time()
+
+    def total(self):
+        return sum(duration for _, duration, _ in self.spans)
+
+    def as_dict(self):
+        return {
+            "trace": self.name,
+            "started": self.started,
+            "spans": [{"stage": name, "seconds": round(duration, 6), **attrs} for name, duration, attrs in self.spans],
+        }
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "start")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        attrs = self.attrs
+        if exc_type is not None:
+            attrs = {**attrs, "error": exc_type.__name__}
+        record(self.name, time.perf_counter() - self.start, **attrs)
+        return False
+
+
+def span(name, **attrs):
+    """
+    Měření fáze: `with metrics.span("decode_masks"): ...`
+    Když je měření vypnuté, vrací sdílený prázdný context manager (téměř nulová režie).
+    """
+    if not _enabled:
+        return _NOOP
+    return _Span(name, attrs)
+
+
+def record(name, duration, **attrs):
+    """Zaznamená dobu trvání fáze do histogramu a do aktuálního trace"""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS)}
+        histogram["count"] += 1
+        histogram["sum"] += duration
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                histogram["buckets"][i] += 1
+
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append((name, duration, attrs))
+
+
+def inc(name, value=1):
+    """Přičte hodnotu k čítači (např. počet odeslaných bytů)"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def start_trace(name):
+    """Začne nový trace pro aktuální vlákno / kontext a vrátí ho"""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace):
+    """Ukončí trace: zapíše strukturovaný log a případně Prometheus soubor"""
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    if not _enabled:
+        return trace
+    if METRICS_LOG:
+        logger.info(json.dumps(trace.as_dict(), ensure_ascii=False))
+    if METRICS_FILE:
+        write_prometheus(METRICS_FILE)
+    return trace
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def render_prometheus():
+    """Metriky v textovém formátu Prometheus"""
+    lines = [
+        "# HELP segmenstory_stage_duration_seconds Doba trvání fází pipeline",
+        "# TYPE segmenstory_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        for name, histogram in sorted(_histograms.items()):
+            stage = _metric_name(name)
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                lines.append(f'segmenstory_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'segmenstory_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'segmenstory_stage_duration_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+            lines.append(f'segmenstory_stage_duration_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+        for name, value in sorted(_counters.items()):
+            metric = f"segmenstory_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Atomicky zapíše metriky do souboru (např. pro node_exporter textfile collector)"""
+    # Vlastní dočasný soubor pro každý zápis - souběžné finish_trace() si ho nepřepíšou
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        # mkstemp vytváří soubor jen pro vlastníka, collector ho ale musí přečíst
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
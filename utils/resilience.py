@@ -0,0 +1,174 @@
+import contextvars
+import email.utils
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import RETRY_POLICIES, HEDGE_AFTER_SECONDS
+
+# Stavové kódy, u kterých má smysl to zkusit znovu (rate limit, přetížení, načítání modelu)
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+
+def _network_errors():
+    """
+    Chyby spojení, které se opakují vždy. requests se tu neimportuje - chyba z requests
+    může nastat jen tehdy, když už ho načetl transport.
+    """
+    requests = sys.modules.get("requests")
+    if requests is None:
+        return (ConnectionError, TimeoutError)
+    return (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)
+
+
+# Sdílený pool pro hedged požadavky
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def retry_after_seconds(headers=None, body=None):
+    """
+    Kolik sekund počkat podle odpovědi serveru: hlavička Retry-After (sekundy nebo HTTP datum),
+    případně "estimated_time" z JSON odpovědi Hugging Face při načítání modelu. Jinak None.
+    """
+    value = (headers or {}).get("Retry-After") or (headers or {}).get("retry-after")
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        # Nečitelné datum ("soon") se ignoruje - nesmí přebít původní chybu odpovědi
+        try:
+            parsed = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            parsed = None
+        if parsed is not None:
+            return max(parsed.timestamp() - time.time(), 0.0)
+    if isinstance(body, dict) and "estimated_time" in body:
+        try:
+            return max(float(body["estimated_time"]), 0.0)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def retry_after_from_response(response):
+    """retry_after_seconds pro requests.Response (tělo nemusí být JSON)"""
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    return retry_after_seconds(response.headers, body)
+
+
+class RetryPolicy:
+    """
+    Exponenciální backoff s plným jitterem a celkovým časovým limitem (deadline).
+    Pokud server řekne, kdy to zkusit znovu (Retry-After / estimated_time), řídí se tím.
+    """
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, deadline=60.0, retry_statuses=RETRY_STATUSES):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_statuses = retry_statuses
+
+    def is_retryable(self, error, retry_on=()):
+        if isinstance(error, _network_errors() + tuple(retry_on)):
+            return True
+        return getattr(error, "status_code", None) in self.retry_statuses
+
+    def delay(self, attempt, retry_after=None):
+        """Čekání před dalším pokusem (attempt = počet dosud neúspěšných pokusů)"""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def get_policy(provider):
+    """Politika opakování pro poskytovatele podle RETRY_POLICIES v configu"""
+    return RetryPolicy(**RETRY_POLICIES.get(provider, {}))
+
+
+def call_with_retry(fn, policy, retry_on=()):
+    """
+    Zavolá `fn()` a při přechodné chybě to zkusí znovu podle `policy`.
+    Chyba může nést `retry_after` (sekundy) - pak se čeká tak dlouho, jak řekl server.
+    Když další čekání překročí deadline, vyhodí se poslední chyba hned.
+    """
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            attempt += 1
+            if attempt >= policy.max_attempts or not policy.is_retryable(e, retry_on):
+                raise
+            delay = policy.delay(attempt, getattr(e, "retry_after", None))
+            remaining = policy.deadline - (time.monotonic() - start)
+            if delay >= remaining:
+                raise
+            time.sleep(delay)
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+        return _hedge_pool
+
+
+def _discard(future):
+    """Výsledek prohraného pokusu se zahodí - otevřenou odpověď (stream LLM) je třeba zavřít"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def hedged_call(fn, hedge_after, max_hedges=1):
+    """
+    Pokud `fn()` neskončí do `hedge_after` sekund, spustí souběžně další pokus
+    (nejvýše `max_hedges` navíc) a vrátí první úspěšný výsledek.
+    Pomalejší pokusy doběhnou na pozadí, jejich výsledek se zahodí (a zavře, má-li close()).
+    """
+    if not hedge_after:
+        return fn()
+
+    pool = _get_hedge_pool()
+    # Každý pokus běží v kopii kontextu volajícího (session pro admission, trace pro metriky)
+    pending = {pool.submit(contextvars.copy_context().run, fn)}
+    launched = 1
+    last_error = None
+    while pending:
+        timeout = hedge_after if launched <= max_hedges else None
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            for other in (done | pending) - {future}:
+                other.cancel()
+                other.add_done_callback(_discard)
+            return result
+        # Nic úspěšně nedoběhlo včas (nebo pokus selhal) - přidáme další pokus, je-li povolen
+        if launched <= max_hedges:
+            pending.add(pool.submit(contextvars.copy_context().run, fn))
+            launched += 1
+    raise last_error
+
+
+def resilient_call(provider, fn, retry_on=()):
+    """Opakování s backoffem a volitelným hedgingem podle nastavení poskytovatele"""
+    hedge_after = HEDGE_AFTER_SECONDS.get(provider, 0)
+    return call_with_retry(lambda: hedged_call(fn, hedge_after), get_policy(provider), retry_on)
@@ -0,0 +1,161 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from io import BytesIO
+
+from utils.cache import DiskCache
+from config import (
+    SESSION_MAX_BYTES, SESSION_STORE_MAX_BYTES, SESSION_IDLE_SECONDS,
+    SESSION_SPILL_DIR, SESSION_SPILL_MAX_BYTES,
+    SESSION_DISPLAY_MAX_SIZE, SESSION_IMAGE_QUALITY
+)
+
+
+def encode_display_image(pil_img, max_size=SESSION_DISPLAY_MAX_SIZE, quality=SESSION_IMAGE_QUALITY):
+    """
+    Zmenší obrázek na velikost pro zobrazení a zakóduje ho do JPEG.
+    st.image přijímá přímo bytes, takže se na serveru už znovu nedekóduje.
+    """
+    if pil_img.mode != "RGB":
+        pil_img = pil_img.convert("RGB")
+    if max(pil_img.size) > max_size:
+        pil_img = pil_img.copy()
+        pil_img.thumbnail((max_size, max_size))
+    buffer = BytesIO()
+    pil_img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class _Session:
+    __slots__ = ("items", "nbytes", "last_access")
+
+    def __init__(self):
+        self.items = {}
+        self.nbytes = 0
+        self.last_access = time.monotonic()
+
+
+class SessionStore:
+    """
+    Úložiště velkých dat sessions (zakódované obrázky) mimo st.session_state.
+    Každá session má tvrdý limit `max_session_bytes` (při překročení se zahodí její nejstarší položky).
+    Sessions nečinné déle než `idle_seconds`, a při překročení `max_memory_bytes` i ty nejdéle
+    nepoužité, se přesunou do `spill` (DiskCache) a při dalším přístupu se načtou zpět.
+    """
+    def __init__(self, max_session_bytes=SESSION_MAX_BYTES, max_memory_bytes=SESSION_STORE_MAX_BYTES,
+                 idle_seconds=SESSION_IDLE_SECONDS, spill=None):
+        self.max_session_bytes = max_session_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.idle_seconds = idle_seconds
+        self.spill = spill
+        # session_id -> _Session, seřazené od nejdéle nepoužité
+        self._sessions = OrderedDict()
+        self._memory_bytes = 0
+        self._spilled = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_session_id():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def _spill_key(session_id, name):
+        return f"{session_id}:{name}"
+
+    def _touch(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _remove_item(self, session, name):
+        data = session.items.pop(name, None)
+        if data is not None:
+            session.nbytes -= len(data)
+            self._memory_bytes -= len(data)
+
+    def put(self, session_id, name, data):
+        """Uloží bytes pod jménem `name` pro danou session"""
+        if len(data) > self.max_session_bytes:
+            raise ValueError(f"Data ({len(data)} B) přesahují limit session ({self.max_session_bytes} B)")
+
+        with self._lock:
+            session = self._touch(session_id)
+            self._remove_item(session, name)
+            # Limit session: nejdřív se zahodí nejstarší položky téže session
+            while session.items and session.nbytes + len(data) > self.max_session_bytes:
+                self._remove_item(session, next(iter(session.items)))
+            session.items[name] = data
+            session.nbytes += len(data)
+            self._memory_bytes += len(data)
+        self._spill_sessions()
+
+    def get(self, session_id, name):
+        """Vrátí uložená bytes, nebo None (nikdy neuloženo, smazáno nebo vyhozeno i ze spill úložiště)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and name in session.items:
+                self._touch(session_id)
+                return session.items[name]
+
+        if self.spill is None:
+            return None
+        data = self.spill.get(self._spill_key(session_id, name))
+        if data is not None and len(data) <= self.max_session_bytes:
+            # Session je znovu aktivní - zpátky do paměti
+            self.put(session_id, name, data)
+            self.spill.delete(self._spill_key(session_id, name))
+        return data
+
+    def drop(self, session_id, name=None):
+        """Smaže jednu položku nebo celou session (z paměti i ze spill úložiště)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            names = [name] if name is not None else list(session.items if session else [])
+            if session is not None:
+                for item_name in names:
+                    self._remove_item(session, item_name)
+                if not session.items:
+                    del self._sessions[session_id]
+        if self.spill is not None:
+            for item_name in names:
+                self.spill.delete(self._spill_key(session_id, item_name))
+
+    def _spill_sessions(self):
+        """Přesune nečinné sessions a při nedostatku paměti i nejdéle nepoužité na disk"""
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                over_budget = self._memory_bytes > self.max_memory_bytes and len(self._sessions) > 1
+                if not over_budget and now - session.last_access < self.idle_seconds:
+                    # Seřazeno od nejdéle nepoužité - další už jsou aktivnější
+                    break
+                del self._sessions[session_id]
+                self._memory_bytes -= session.nbytes
+                victims.append((session_id, session))
+            self._spilled += len(victims)
+
+        if self.spill is None:
+            return
+        for session_id, session in victims:
+            for name, data in session.items.items():
+                try:
+                    self.spill.put(self._spill_key(session_id, name), data)
+                except OSError:
+                    # Selhání disku - data session se ztratí, uživatel segmentuje znovu
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "memory_bytes": self._memory_bytes,
+                "spilled_sessions": self._spilled,
+            }
+
+
+store = SessionStore(spill=DiskCache(SESSION_SPILL_DIR, SESSION_SPILL_MAX_BYTES) if SESSION_SPILL_DIR else None)
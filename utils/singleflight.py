@@ -0,0 +1,93 @@
+import threading
+
+from utils import metrics
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "abandoned")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Leader skončil jinak než výsledkem nebo Exception (např. přerušený Streamlit rerun)
+        self.abandoned = False
+
+    def get(self):
+        """Výsledek dokončeného volání, nebo jeho výjimka"""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Slučování shodných souběžných volání: první volající s daným klíčem (leader) provede `fn`,
+    ostatní počkají na jeho výsledek a dostanou stejný výsledek nebo stejnou výjimku.
+    Na rozdíl od cache nic neuchovává - po dokončení volání se klíč uvolní.
+    """
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """
+        Provede `fn()` nebo se připojí k již běžícímu volání se stejným klíčem.
+        Vrací (výsledek, shared) - shared je True, když výsledek spočítal jiný volající.
+        Čekající volající po `timeout` sekundách vyhodí TimeoutError (leader běží dál).
+        Čekajícím se předává jen Exception - když leadera přeruší BaseException (RerunException
+        a StopException ve Streamlitu nesou stav jeho session), volání se zahodí a čekající
+        to zkusí znovu, jeden z nich jako nový leader.
+        """
+        while True:
+            call, leader = self.begin(key)
+            if leader:
+                break
+            if self.wait(call, timeout):
+                return call.get(), True
+
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, call, error=e)
+            raise
+        except BaseException:
+            self.finish(key, call, abandoned=True)
+            raise
+        self.finish(key, call, result=result)
+        return result, False
+
+    def begin(self, key):
+        """
+        Zaregistruje volání s klíčem bez jeho provedení (dávky, které volají backend samy).
+        Vrací (call, leader). Leader musí volání vždy ukončit přes finish(), ostatní čekají přes wait().
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                return call, True
+        metrics.inc(f"{self.name}_coalesced")
+        return call, False
+
+    def finish(self, key, call, result=None, error=None, abandoned=False):
+        """Předá čekajícím výsledek, výjimku, nebo (abandoned) pokyn zkusit to znovu, a uvolní klíč"""
+        call.result = result
+        call.error = error
+        call.abandoned = abandoned
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def wait(self, call, timeout=None):
+        """
+        Počká na dokončení volání z begin(). Vrací False, když ho leader opustil (je třeba to zkusit
+        znovu), jinak True a výsledek dá call.get(). Po `timeout` sekundách vyhodí TimeoutError.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not call.done.wait(timeout):
+            raise TimeoutError(f"Čekání na souběžný požadavek ({self.name}) vypršelo")
+        return not call.abandoned
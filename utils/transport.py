@@ -0,0 +1,100 @@
+import hashlib
+import threading
+from urllib.parse import urlsplit
+
+from utils.cache import LRUCache
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_CONNECT_TIMEOUT, OPENAI_CLIENT_CACHE_SIZE
+
+# Sessions a klienti žijí na úrovni modulu, takže přežijí Streamlit reruny
+# a sdílí je všechny sessions v jednom procesu.
+_sessions = {}
+_sessions_lock = threading.Lock()
+_openai_clients = LRUCache(OPENAI_CLIENT_CACHE_SIZE)
+_openai_lock = threading.Lock()
+
+
+def _host_key(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_session(url, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+    """Vrátí sdílenou keep-alive session pro hosta z `url`."""
+    key = _host_key(url)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            # requests (~100 ms importu) se načítá až s prvním požadavkem, ne při startu aplikace
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+            session.mount(f"{urlsplit(url).scheme}://", adapter)
+            _sessions[key] = session
+        return session
+
+
+def request_timeout(read_timeout):
+    """Timeout pro requests: (připojení, čtení)"""
+    return (HTTP_CONNECT_TIMEOUT, read_timeout)
+
+
+def post(url, read_timeout=30, **kwargs):
+    """POST přes sdílenou session (bez nového DNS/TCP/TLS handshaku pro známé hosty)."""
+    return get_session(url).post(url, timeout=request_timeout(read_timeout), **kwargs)
+
+
+def get_openai_client(api_key, base_url=None, read_timeout=60):
+    """Vrátí sdíleného OpenAI klienta pro daný API klíč (klient si drží vlastní keep-alive pool)."""
+    import openai
+
+    # Klíč v paměti neukládáme v čitelné podobě
+    key = hashlib.sha256(f"{api_key}:{base_url}:{read_timeout}".encode("utf-8")).hexdigest()
+    with _openai_lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            # Opakování řídí utils.resilience, vestavěné opakování klienta vypínáme
+            client = openai.OpenAI(api_key=api_key, base_url=base_url, timeout=read_timeout, max_retries=0)
+            _openai_clients.put(key, client)
+        return client
+
+
+def get_async_openai_client(api_key, base_url=None, read_timeout=60):
+    """
+    Vrátí sdíleného asynchronního OpenAI klienta (i pro OpenAI-kompatibilní API jako Perplexity).
+    Asynchronní klient je vázaný na event loop, používá se jen ze smyčky prefetcheru.
+    """
+    import openai
+
+    key = hashlib.sha256(f"async:{api_key}:{base_url}:{read_timeout}".encode("utf-8")).hexdigest()
+    with _openai_lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            # Ani prefetch nesmí opakovat skrytě mimo admission a politiku opakování
+            client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=read_timeout, max_retries=0)
+            _openai_clients.put(key, client)
+        return client
+
+
+def warm_up(urls=()):
+    """
+    Načte HTTP knihovny a SDK poskytovatelů a připraví sessions pro `urls` (bez síťového provozu).
+    Volá se na pozadí po startu, aby import nečekal až první požadavek uživatele.
+    """
+    for url in urls:
+        get_session(url)
+    try:
+        import openai  # noqa: F401
+    except ImportError:
+        pass
+
+
+def close_all():
+    """Zavře všechna sdílená spojení (např. při ukončení batch běhu)."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+    with _openai_lock:
+        _openai_clients.clear()